@@ -11,6 +11,10 @@ from .solver import (
     CPModel1,
     Algorithm,
     Iterator1,
+    SerialSGS,
+    ParallelSGS,
+    GeneticAlgorithm,
+    LocalSearch,
 )
 from .tests import get_test_instance
 from cornflow_client import ApplicationCore, get_empty_schema
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class InstanceArrays(object):
+    """
+    Dense numpy representation of an instance.
+    Jobs, modes and resources are referred to by their position:
+    jobs[i] is the id of job i, modes[m] is the id of mode m and
+    resources[r] is the id of resource r.
+
+    Modes that a job does not have are marked as False in mode_mask
+    and have zero duration and needs.
+    Successors are stored in CSR form: the successors of job i are
+    successors_indices[successors_indptr[i]:successors_indptr[i + 1]].
+    """
+
+    def __init__(self, instance):
+        data = instance.data
+        self.jobs = sorted(data["jobs"].keys())
+        self.job_index = {j: i for i, j in enumerate(self.jobs)}
+        self.modes = sorted({m for modes in data["durations"].values() for m in modes})
+        self.mode_index = {m: i for i, m in enumerate(self.modes)}
+        self.resources = data["resources"].keys_l()
+        self.resource_index = {r: i for i, r in enumerate(self.resources)}
+        n_jobs, n_modes, n_res = len(self.jobs), len(self.modes), len(self.resources)
+
+        self.durations = np.zeros((n_jobs, n_modes), dtype=np.int64)
+        self.mode_mask = np.zeros((n_jobs, n_modes), dtype=bool)
+        self.needs = np.zeros((n_jobs, n_modes, n_res), dtype=np.int64)
+        for job, modes in data["durations"].items():
+            i = self.job_index[job]
+            for mode, duration in modes.items():
+                m = self.mode_index[mode]
+                self.durations[i, m] = duration
+                self.mode_mask[i, m] = True
+                for resource, need in data["needs"][job][mode].items():
+                    self.needs[i, m, self.resource_index[resource]] = need
+
+        resources = data["resources"]
+        self.availability = np.array(
+            [resources[r]["available"] for r in self.resources], dtype=np.int64
+        )
+        self.renewable = np.array(
+            [instance.is_resource_renewable(resources[r]) for r in self.resources],
+            dtype=bool,
+        )
+
+        successors = [
+            [self.job_index[s] for s in data["jobs"][j]["successors"]]
+            for j in self.jobs
+        ]
+        self.successors_indptr = np.zeros(n_jobs + 1, dtype=np.int64)
+        self.successors_indptr[1:] = np.cumsum([len(s) for s in successors])
+        self.successors_indices = np.array(
+            [s for succ in successors for s in succ], dtype=np.int64
+        )
+
+        # the same arcs as two aligned arrays of job positions (before, after)
+        self.arcs = (
+            np.repeat(np.arange(n_jobs), np.diff(self.successors_indptr)),
+            self.successors_indices,
+        )
+
+    @property
+    def n_jobs(self) -> int:
+        return len(self.jobs)
+
+    def successors(self, i: int) -> np.ndarray:
+        """
+        Positions of the successors of the job in position i.
+        """
+        start, end = self.successors_indptr[i], self.successors_indptr[i + 1]
+        return self.successors_indices[start:end]
+
+    def to_positions(self, values: dict, index: dict = None) -> np.ndarray:
+        """
+        Converts a dictionary {job: id} into an array aligned with self.jobs.
+        Ids are translated with index (for example, self.mode_index).
+        """
+        result = np.empty(self.n_jobs, dtype=np.int64)
+        for job, i in self.job_index.items():
+            value = values[job]
+            result[i] = value if index is None else index[value]
+        return result
@@ -2,16 +2,26 @@
 
 from . import experiment as exp
 from . import tools as di
+from .cache import ResultsIndex
 
-import pytups.tuplist as tl
 import pytups.superdict as sd
 
 import orloge as ol
 import os
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 import zipfile
 import pandas as pd
 import shutil
 import re
+import warnings
+
+# file with the finished experiments of a scenario (see run_batch.solve_zip)
+MANIFEST = "manifest.json"
+
+# the batch of each worker process (see Batch.get_summaries)
+_worker_batch = None
 
 
 class Batch(object):
@@ -26,6 +36,7 @@ class Batch(object):
 
     /PATH/TO/BATCH/scenario1/instance1/ is assumed to be the path for an experiment.
         names are obtained by inspection so it can be any name for scenario or instance.
+        If a scenario has a manifest.json, its experiments are the ones listed there.
 
     if no_scenario is True:
     /PATH/TO/BATCH/instance1/
@@ -34,39 +45,71 @@ class Batch(object):
     /PATH/TO/BATCH/instanceY/
     """
 
-    def __init__(self, path, no_scenario=False, scenarios=None, exp_obj=None):
+    def __init__(
+        self,
+        path,
+        no_scenario=False,
+        scenarios=None,
+        exp_obj=None,
+        workers=1,
+        results_index=None,
+    ):
         """
 
         :param path: path to results
         :param no_scenario: if True, there is no scenarios, instances directly
         :param scenarios: in order to filter the scenarios to load
+        :param workers: number of processes used to load and check the experiments
+        :param results_index: path to a sqlite file where the summaries of the
+            experiments are kept between runs (see ResultsIndex)
         """
         self.path = path
         self.cases = None
+        self.summaries = None
         self.logs = None
         self.errors = None
         self.options = None
         self.seeds = None
         self.no_scenario = no_scenario
         self.scenarios = scenarios
+        self.workers = workers
+        self.results_index = results_index
+        # instances shared by several experiments are read only once
+        self.instances = {}
         if exp_obj is None:
-            self.load_experiment = exp.Experiment.from_json
-        else:
-            self.load_experiment = exp_obj.from_json
+            exp_obj = exp.Experiment
+        self.exp_obj = exp_obj
 
     def get_instances_paths(self):
         scenarios = self.scenarios
         if scenarios is None:
-            scenarios = os.listdir(self.path)
+            scenarios = [s for s in os.listdir(self.path) if s != exp.INSTANCES_DIR]
         scenario_paths = {s: os.path.join(self.path, s) for s in scenarios}
         if self.no_scenario:
             return sd.SuperDict.from_dict(scenario_paths)
         scenario_instances = {
-            s: os.listdir(v) for s, v in scenario_paths.items() if os.path.isdir(v)
+            s: self.get_scenario_instances(v)
+            for s, v in scenario_paths.items()
+            if os.path.isdir(v)
         }
         scenario_paths_in, instances_paths_in = self.re_make_paths(scenario_instances)
         return sd.SuperDict.from_dict(instances_paths_in).to_dictup()
 
+    @staticmethod
+    def get_scenario_instances(scenario_path):
+        existing = os.listdir(scenario_path)
+        manifest = di.load_data(os.path.join(scenario_path, MANIFEST))
+        if manifest is False:
+            return existing
+        missing = sorted(set(manifest) - set(existing))
+        if missing:
+            warnings.warn(
+                "Experiments in {} without a directory are skipped: {}".format(
+                    scenario_path, missing
+                )
+            )
+        return [name for name in manifest if name not in missing]
+
     def re_make_paths(self, scenario_instances):
         scenario_paths = {s: os.path.join(self.path, s) for s in scenario_instances}
         instances_paths = {
@@ -75,6 +118,14 @@ class Batch(object):
         }
         return scenario_paths, instances_paths
 
+    def load_experiment(self, path, instances=None):
+        """
+        :param instances: where shared instances are kept, self.instances by default
+        """
+        if instances is None:
+            instances = self.instances
+        return self.exp_obj.from_json(path, instances=instances)
+
     def get_cases(self):
         if self.cases is not None:
             return self.cases
@@ -83,6 +134,110 @@ class Batch(object):
         self.cases = self.get_instances_paths().vapply(load_data)
         return self.cases
 
+    def iter_experiments(self):
+        """
+        Loads the experiments one at a time, without keeping them.
+        Only the last shared instance read is kept in memory.
+
+        :return: a generator of (scenario, instance, Experiment).
+            scenario is None if no_scenario is True.
+        """
+        for key, experiment in self._iter_cases():
+            if self.no_scenario:
+                yield None, key, experiment
+            else:
+                yield key[0], key[1], experiment
+
+    def iter_objective_function(self):
+        """
+        :return: a generator of (experiment key, objective)
+        """
+        for key, experiment in self._iter_cases():
+            yield key, experiment.get_objective()
+
+    def iter_errors(self):
+        """
+        :return: a generator of (experiment key, number of errors)
+        """
+        for key, experiment in self._iter_cases():
+            yield key, _count_errors(experiment)
+
+    def _iter_cases(self):
+        if self.cases is not None:
+            yield from self.cases.items()
+            return
+        instances = _LastInstance()
+        for key, path in self.get_instances_paths().items():
+            yield key, self.load_experiment(path, instances)
+
+    def read_json(self, path, name):
+        return di.load_data(os.path.join(path, name))
+
+    def get_summary(self, path):
+        """
+        Loads and checks one experiment.
+
+        :return: objective, number of errors and options of the experiment
+        """
+        experiment = self.load_experiment(path)
+        return dict(
+            objective=experiment.get_objective(),
+            errors=_count_errors(experiment),
+            options=self.read_json(path, "options.json"),
+        )
+
+    def get_hashes(self):
+        """
+        :return: {experiment key: hash of the content of its files}
+        """
+        return self.get_instances_paths().vapply(_hash_directory)
+
+    def get_summaries(self):
+        """
+        Summary of every experiment (see get_summary).
+        With more than one worker, the experiments are loaded and checked in a
+        process pool and only the summaries are sent back.
+        With a results_index, only new or changed experiments are checked.
+        """
+        if self.summaries is not None:
+            return self.summaries
+
+        paths = self.get_instances_paths()
+        if self.results_index is None:
+            self.summaries = self._summarize(paths)
+            return self.summaries
+
+        # rows are keyed by scenario/instance, the path inside the batch
+        names = paths.kapply(lambda k: k if self.no_scenario else "/".join(k))
+        hashes = {names[k]: v for k, v in self.get_hashes().items()}
+        with ResultsIndex(self.results_index) as index:
+            stored = index.get(hashes)
+            new = self._summarize(paths.kfilter(lambda k: names[k] not in stored))
+            index.update(hashes, {names[k]: v for k, v in new.items()})
+        self.summaries = paths.kapply(
+            lambda k: new[k] if k in new else stored[names[k]]
+        )
+        return self.summaries
+
+    @property
+    def use_summaries(self):
+        return self.workers > 1 or self.results_index is not None
+
+    def _summarize(self, paths):
+        if self.workers <= 1 or len(paths) <= 1:
+            return paths.vapply(self.get_summary)
+        settings = dict(
+            no_scenario=self.no_scenario, scenarios=self.scenarios, exp_obj=self.exp_obj
+        )
+        chunksize = max(1, len(paths) // (4 * self.workers))
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_start_worker,
+            initargs=(type(self), self.path, settings),
+        ) as executor:
+            summaries = executor.map(_get_summary, paths.values(), chunksize=chunksize)
+            return sd.SuperDict(zip(paths.keys(), summaries))
+
     def get_solver(self):
         opt_info = self.get_options()
         available_solvers = ["CPLEX", "GUROBI", "CBC"]
@@ -104,20 +259,63 @@ class Batch(object):
                 return s
         return default
 
-    def get_logs(self, get_progress=False):
-        if self.logs is not None:
-            return self.logs
-
-        solver = self.get_solver()
-
-        self.logs = (
+    def read_logs(self):
+        """
+        :return: {experiment key: content of results.log}
+        """
+        return (
             self.get_instances_paths()
             .vapply(lambda v: os.path.join(v, "results.log"))
             .clean(func=os.path.exists)
-            .vapply(lambda v: ol.get_info_solver(v, solver, get_progress=get_progress))
+            .vapply(di.read_text)
         )
+
+    def get_logs(self, get_progress=False, solver=None):
+        """
+        Parses the logs of the experiments.
+        Identical logs are parsed once, in a process pool if workers > 1.
+        With a results_index, parsed logs are kept there, keyed by their hash.
+        """
+        if self.logs is not None:
+            return self.logs
+
+        if not solver:
+            solver = self.get_solver()
+
+        logs = self.read_logs()
+        hashes = logs.vapply(_hash_log, get_orloge_version(), solver, get_progress)
+        contents = {h: logs[k] for k, h in hashes.items()}
+        parsed = {}
+        if self.results_index is not None:
+            with ResultsIndex(self.results_index) as index:
+                parsed = index.get_logs(contents.keys())
+        missing = {h: v for h, v in contents.items() if h not in parsed}
+        new = self._parse_logs(missing, solver, get_progress)
+        if self.results_index is not None and new:
+            with ResultsIndex(self.results_index) as index:
+                index.update_logs(new)
+        parsed.update(new)
+        self.logs = hashes.vapply(lambda h: parsed[h])
         return self.logs
 
+    def _parse_logs(self, contents, solver, get_progress):
+        """
+        :param contents: {hash: content of the log}
+        :return: {hash: parsed log}
+        """
+        if self.workers <= 1 or len(contents) <= 1:
+            return {h: _parse_log(v, solver, get_progress) for h, v in contents.items()}
+        chunksize = max(1, len(contents) // (4 * self.workers))
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            parsed = executor.map(
+                _parse_log,
+                contents.values(),
+                itertools.repeat(solver),
+                itertools.repeat(get_progress),
+                chunksize=chunksize,
+            )
+            return dict(zip(contents.keys(), parsed))
+
     def get_json(self, name):
         load_data = di.load_data
 
@@ -133,19 +331,28 @@ class Batch(object):
         if self.errors is not None:
             return self.errors
 
-        self.errors = (
-            self.get_cases()
-            .vapply(lambda v: v.check_solution().to_lendict().values())
-            .vapply(sum)
-        )
+        if self.use_summaries:
+            self.errors = self.get_summaries().get_property("errors")
+            return self.errors
+        self.errors = sd.SuperDict(self.iter_errors())
         return self.errors
 
     def get_objective_function(self):
-        return self.get_cases().vapply(lambda v: v.get_objective())
+        if self.use_summaries:
+            return self.get_summaries().get_property("objective")
+        return sd.SuperDict(self.iter_objective_function())
 
     def get_options(self):
         if self.options is not None:
             return self.options
+        if self.use_summaries:
+            self.options = (
+                self.get_summaries()
+                .get_property("options")
+                .clean()
+                .vapply(sd.SuperDict.from_dict)
+            )
+            return self.options
         self.options = self.get_json("options.json")
         return self.options
 
@@ -173,15 +380,17 @@ class Batch(object):
         log_info = self.get_logs(**kwargs)
         table = self.format_df(log_info)
 
+        # dictionaries are expanded in columns, all at once
+        tables = [table]
         for name in ["matrix", "presolve", "matrix_post"]:
-            try:
-                aux_table = table[name].apply(pd.Series)
-                aux_table.columns = [name + "_" + c for c in aux_table.columns]
-                table = pd.concat([table, aux_table], axis=1)
-            except:
-                pass
+            if name not in table:
+                continue
+            values = [v if isinstance(v, dict) else {} for v in table[name]]
+            aux_table = pd.DataFrame(values, index=table.index)
+            aux_table.columns = [name + "_" + c for c in aux_table.columns]
+            tables.append(aux_table)
 
-        return table
+        return pd.concat(tables, axis=1)
 
     def get_status_df(self):
         table = self.get_log_df()
@@ -263,9 +472,72 @@ class Batch(object):
         return paths.values_l()
 
 
+def _count_errors(experiment):
+    return sum(experiment.check_solution().to_lendict().values())
+
+
+class _LastInstance(dict):
+    """
+    Instances shared by experiments, keeping only the last one.
+    """
+
+    def __setitem__(self, key, value):
+        self.clear()
+        super().__setitem__(key, value)
+
+
+def get_orloge_version() -> str:
+    """
+    Parsed logs depend on the version of the parser (see Batch.get_logs).
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        # python 3.7
+        import pkg_resources
+
+        return pkg_resources.get_distribution("orloge").version
+    return metadata.version("orloge")
+
+
+def _hash_log(content, version, solver, get_progress):
+    key = "{}/{}/{}/".format(version, solver, get_progress)
+    return hashlib.sha1((key + content).encode()).hexdigest()
+
+
+def _parse_log(content, solver, get_progress):
+    return ol.get_info_solver(content, solver, get_progress=get_progress, content=True)
+
+
+def _start_worker(batch_class, path, settings):
+    global _worker_batch
+    _worker_batch = batch_class(path, **settings)
+
+
+def _get_summary(path):
+    return _worker_batch.get_summary(path)
+
+
+def _hash_directory(path):
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode())
+            with open(file_path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
 class ZipBatch(Batch):
     """
     Only difference is it's contained inside a zip file.
+    The zip is opened once and its members are indexed by experiment,
+    so it is better used as a context manager:
+
+        with ZipBatch(path) as batch:
+            batch.get_objective_function()
     """
 
     def __init__(self, path, *args, **kwargs):
@@ -276,73 +548,130 @@ class ZipBatch(Batch):
         elif ext != zip_ext:
             raise ValueError("Only zip is supported")
         super().__init__(path, *args, **kwargs)
+        self._zipobj = None
+        self._paths = None
+        self._index = None
 
-    def get_instances_paths(self):
+    @property
+    def zipobj(self) -> zipfile.ZipFile:
+        if self._zipobj is None:
+            self._zipobj = zipfile.ZipFile(self.path)
+        return self._zipobj
+
+    def close(self):
+        if self._zipobj is not None:
+            self._zipobj.close()
+            self._zipobj = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_index(self) -> sd.SuperDict:
+        """
+        Members of each experiment, read in one pass over the names of the zip.
+
+        :return: {experiment key: {file name: member}}.
+            file names are relative to the experiment (input.json, results.log...)
+        """
+        if self._index is not None:
+            return self._index
         num_slashes = 2
-        keys_positions = [1, 2]
         if self.no_scenario:
             num_slashes = 1
-            keys_positions = 1
-        zipobj = zipfile.ZipFile(self.path)
-        all_files = tl.TupList(di.dirs_in_zip(zipobj))
-        scenario_instances = all_files.vfilter(lambda f: f.count("/") == num_slashes)
-        keys = (
-            scenario_instances.vapply(str.split, "/").vapply(tuple).take(keys_positions)
-        )
-        result_dict = sd.SuperDict(zip(keys, scenario_instances))
+        experiments = {}
+        manifests = {}
+        for name in self.zipobj.namelist():
+            parts = name.split("/")
+            if parts[1:2] == [exp.INSTANCES_DIR]:
+                continue
+            if not self.no_scenario and parts[2:] == [MANIFEST]:
+                # root/scenario/manifest.json lists the experiments of the scenario
+                manifests["/".join(parts[:2])] = name
+                continue
+            if len(parts) <= num_slashes + 1:
+                continue
+            path = "/".join(parts[: num_slashes + 1])
+            files = experiments.setdefault(path, {})
+            if parts[-1]:
+                # directories have no file name
+                files["/".join(parts[num_slashes + 1 :])] = name
+        for scenario, name in manifests.items():
+            listed = {
+                scenario + "/" + instance
+                for instance in di.load_data_zip(self.zipobj, name)
+            }
+            for path in [p for p in experiments if p.startswith(scenario + "/")]:
+                if path not in listed:
+                    del experiments[path]
+            missing = sorted(p for p in listed if p not in experiments)
+            if missing:
+                warnings.warn(
+                    "Experiments in {} without files in the zip are skipped: {}".format(
+                        name, missing
+                    )
+                )
+
+        def get_key(path):
+            parts = path.split("/")
+            if self.no_scenario:
+                return parts[1]
+            return tuple(parts[1:])
+
+        self._paths = sd.SuperDict({get_key(p): p for p in experiments})
+        self._index = sd.SuperDict({get_key(p): v for p, v in experiments.items()})
         if self.scenarios:
             scenarios = set(self.scenarios)
-            return result_dict.kfilter(lambda k: k[0] in scenarios)
-        else:
-            return result_dict
+            self._paths = self._paths.kfilter(lambda k: k[0] in scenarios)
+            self._index = self._index.kfilter(lambda k: k[0] in scenarios)
+        return self._index
 
-    def get_cases(self):
-        if self.cases is not None:
-            return self.cases
+    def get_instances_paths(self):
+        self.get_index()
+        return self._paths
 
-        zipobj = zipfile.ZipFile(self.path)
-        load_data = lambda e: exp.Experiment.from_zipped_json(zipobj, e)
-        self.cases = self.get_instances_paths().vapply(load_data)
-        return self.cases
+    def get_hashes(self):
+        """
+        The hash of an experiment comes from the names, CRCs and sizes of its
+        members, which are in the central directory: no member is read.
+        """
 
-    def get_logs(self, get_progress=False, solver=None):
-        if self.logs is not None:
-            return self.logs
+        def get_hash(files):
+            infos = [(name, self.zipobj.getinfo(files[name])) for name in sorted(files)]
+            content = [(name, i.CRC, i.file_size) for name, i in infos]
+            return hashlib.sha1(repr(content).encode()).hexdigest()
 
-        zipobj = zipfile.ZipFile(self.path)
-        if not solver:
-            solver = self.get_solver()
+        return self.get_index().vapply(get_hash)
 
-        def _read_zip(x):
-            try:
-                return zipobj.read(x)
-            except:
-                return 0
+    def get_members(self, name) -> sd.SuperDict:
+        """
+        :return: {experiment key: member} for the experiments that have the file
+        """
+        return self.get_index().vapply(lambda v: v.get(name)).clean()
 
-        func_to_get_log = ol.get_info_solver
-        filename = "/results.log"
+    def load_experiment(self, path, instances=None):
+        if instances is None:
+            instances = self.instances
+        return self.exp_obj.from_zipped_json(self.zipobj, path, instances=instances)
 
-        self.logs = (
-            self.get_instances_paths()
-            .vapply(lambda v: v + filename)
-            .vapply(_read_zip)
+    def read_json(self, path, name):
+        return di.load_data_zip(self.zipobj, path + "/" + name)
+
+    def read_logs(self):
+        return (
+            self.get_members("results.log")
+            .vapply(self.zipobj.read)
             .clean()
             .vapply(lambda x: str(x, "utf-8"))
-            .vapply(
-                lambda v: func_to_get_log(
-                    v, solver, get_progress=get_progress, content=True
-                )
-            )
         )
-        return self.logs
 
     def get_json(self, name):
-        zipobj = zipfile.ZipFile(self.path)
-        load_data = lambda v: di.load_data_zip(zipobj=zipobj, path=v)
+        load_data = lambda v: di.load_data_zip(zipobj=self.zipobj, path=v)
 
         return (
-            self.get_instances_paths()
-            .vapply(lambda v: v + "/" + name)
+            self.get_members(name)
             .vapply(load_data)
             .clean()
             .vapply(sd.SuperDict.from_dict)
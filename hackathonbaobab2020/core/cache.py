@@ -0,0 +1,250 @@
+from .instance import Instance, MM_PARSER_VERSION, _parse_mm
+from zipfile import ZipFile
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+import pickle
+import pytups as pt
+import sqlite3
+import tempfile
+
+# pickle protocol 4 is readable by every python version we support
+_PROTOCOL = 4
+
+# change it when the summaries of Batch.get_summary or the parsed logs change
+SUMMARY_VERSION = 2
+
+
+def default_cache_dir() -> str:
+    """
+    A directory for the disk cache: $HACKATHON_CACHE_DIR or
+    ~/.cache/hackathonbaobab2020
+    """
+    path = os.environ.get("HACKATHON_CACHE_DIR")
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".cache", "hackathonbaobab2020")
+
+
+class InstanceCache(object):
+    """
+    Cache of parsed .mm files.
+    Entries are keyed by the sha1 of the raw file and the last memory_size
+    entries are kept in memory.
+    If path is given, entries are also stored as pickles in
+    path/mm_v{MM_PARSER_VERSION}/, so they are shared between processes and
+    runs, and changing the parser version invalidates every previous entry.
+    """
+
+    def __init__(self, path: str = None, memory_size: int = 1000):
+        self.path = None
+        if path is not None:
+            self.path = os.path.join(path, "mm_v{}".format(MM_PARSER_VERSION))
+        self.memory_size = memory_size
+        self.hits = 0
+        self.misses = 0
+        self._memory = {}
+
+    def get_instance(self, content: bytes) -> Instance:
+        """
+        :param content: the raw bytes of a .mm file
+        :return: the parsed instance, from the cache if possible
+        """
+        key = hashlib.sha1(content).hexdigest()
+        raw = self._memory.get(key)
+        if raw is None:
+            raw = self._read(key)
+        # each instance gets its own copy of the data
+        data = self._load(raw)
+        if data is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            data = _parse_mm(content.decode().splitlines())
+            raw = pickle.dumps(data, protocol=_PROTOCOL)
+            self._write(key, raw)
+        self._remember(key, raw)
+        return Instance(data)
+
+    def from_zip(self, zip_obj: ZipFile, filename: str) -> Instance:
+        return self.get_instance(zip_obj.read(filename))
+
+    def stats(self) -> pt.SuperDict:
+        return pt.SuperDict(hits=self.hits, misses=self.misses)
+
+    def clear(self) -> None:
+        """
+        Deletes every entry of the current parser version.
+        """
+        self._memory = {}
+        if self.path is None or not os.path.exists(self.path):
+            return
+        for name in os.listdir(self.path):
+            os.remove(os.path.join(self.path, name))
+
+    def _remember(self, key: str, raw: bytes) -> None:
+        self._memory.pop(key, None)
+        if len(self._memory) >= self.memory_size:
+            # dictionaries keep insertion order: the first one is the oldest
+            self._memory.pop(next(iter(self._memory)))
+        self._memory[key] = raw
+
+    @staticmethod
+    def _load(raw: bytes):
+        if raw is None:
+            return None
+        try:
+            return pickle.loads(raw)
+        except Exception:
+            # a corrupted entry is treated as a miss and overwritten
+            return None
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.path, key + ".pickle")
+
+    def _read(self, key: str):
+        if self.path is None:
+            return None
+        try:
+            with open(self._entry_path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, key: str, raw: bytes) -> None:
+        # several processes can share the cache: we write to a temporary file
+        # and rename it so no one reads a half-written entry.
+        if self.path is None:
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(raw)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError:
+            # the cache is an optimization: if we cannot write, we just parse again
+            pass
+
+
+_instance_cache = None
+
+
+def get_instance_cache() -> InstanceCache:
+    """
+    The cache shared by solve_zip, get_test_instance and HackathonApp.
+    It is kept in memory. It is also kept on disk, in $HACKATHON_CACHE_DIR,
+    only if that variable is set.
+    """
+    global _instance_cache
+    if _instance_cache is None:
+        _instance_cache = InstanceCache(os.environ.get("HACKATHON_CACHE_DIR") or None)
+    return _instance_cache
+
+
+class ResultsIndex(object):
+    """
+    SQLite file with the summary of each experiment of a batch
+    (see Batch.get_summaries).
+    Rows are keyed by the path of the experiment inside the batch and store a
+    hash of its files: a summary is only used while the hash is the same.
+    Changing SUMMARY_VERSION empties the index.
+
+    It also keeps the parsed solver logs (see Batch.get_logs) as json,
+    keyed by a hash of the log.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        (version,) = self.connection.execute("PRAGMA user_version").fetchone()
+        if version != SUMMARY_VERSION:
+            self.connection.execute("DROP TABLE IF EXISTS summaries")
+            self.connection.execute("DROP TABLE IF EXISTS logs")
+            self.connection.execute("PRAGMA user_version = {}".format(SUMMARY_VERSION))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS summaries "
+            "(path TEXT PRIMARY KEY, hash TEXT NOT NULL, summary TEXT NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS logs "
+            "(hash TEXT PRIMARY KEY, info TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get(self, hashes: dict) -> dict:
+        """
+        :param hashes: {path: hash} of the experiments
+        :return: {path: summary} for the experiments stored with the same hash
+        """
+        rows = self.connection.execute("SELECT path, hash, summary FROM summaries")
+        return {
+            path: json.loads(summary)
+            for path, _hash, summary in rows
+            if hashes.get(path) == _hash
+        }
+
+    def update(self, hashes: dict, summaries: dict) -> None:
+        """
+        Stores (or replaces) the summaries of some experiments.
+        """
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)",
+            [(p, hashes[p], json.dumps(v)) for p, v in summaries.items()],
+        )
+        self.connection.commit()
+
+    def get_logs(self, hashes) -> dict:
+        """
+        :param hashes: hashes of the logs
+        :return: {hash: parsed log} for the logs already stored
+        """
+        hashes = set(hashes)
+        rows = self.connection.execute("SELECT hash, info FROM logs")
+        logs = {_hash: info for _hash, info in rows if _hash in hashes}
+        # unreadable entries are treated as missing and parsed again
+        logs = {k: _load_log(v) for k, v in logs.items()}
+        return {k: v for k, v in logs.items() if v is not None}
+
+    def update_logs(self, logs: dict) -> None:
+        """
+        :param logs: {hash: parsed log}
+        """
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO logs VALUES (?, ?)",
+            [(k, json.dumps(v, default=_encode_log)) for k, v in logs.items()],
+        )
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _encode_log(obj):
+    # the progress of orloge is a DataFrame and some values are numpy scalars
+    if isinstance(obj, pd.DataFrame):
+        return {"__dataframe__": obj.to_dict(orient="split")}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("{} is not serializable".format(type(obj).__name__))
+
+
+def _decode_log(obj: dict):
+    if "__dataframe__" in obj:
+        return pd.DataFrame(**obj["__dataframe__"])
+    return obj
+
+
+def _load_log(text: str):
+    try:
+        return json.loads(text, object_hook=_decode_log)
+    except ValueError:
+        return None
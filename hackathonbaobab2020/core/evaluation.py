@@ -0,0 +1,127 @@
+"""
+Vectorized computations over schedules.
+Schedules are given as arrays of positions (see InstanceArrays):
+jobs, modes and start times, aligned.
+"""
+
+import numpy as np
+
+
+def get_renewable_usage(
+    arrays, jobs: np.ndarray, modes: np.ndarray, starts: np.ndarray, periods: int
+) -> np.ndarray:
+    """
+    Usage profile of the renewable resources.
+    A job uses its resources from its start until the period before it finishes.
+    It is computed with a difference array: +need at the start, -need at the finish.
+
+    :param arrays: InstanceArrays
+    :param jobs: positions of the scheduled jobs
+    :param modes: positions of their modes
+    :param starts: their start times (non negative)
+    :param periods: length of the profile
+    :return: array (renewable resources x periods) with the usage.
+        Resources are in the order of arrays.resources.
+    """
+    finishes = starts + arrays.durations[jobs, modes]
+    needs = arrays.needs[jobs, modes][:, arrays.renewable]
+    n_resources = needs.shape[1]
+    diff = np.zeros((n_resources, periods + 1), dtype=np.int64)
+    if len(jobs):
+        resources = np.arange(n_resources)[:, None]
+        np.add.at(diff, (resources, np.minimum(starts, periods)[None, :]), needs.T)
+        np.add.at(diff, (resources, np.minimum(finishes, periods)[None, :]), -needs.T)
+    return np.cumsum(diff[:, :periods], axis=1)
+
+
+def is_feasible(
+    arrays, jobs: np.ndarray, modes: np.ndarray, starts: np.ndarray
+) -> bool:
+    """
+    True if the schedule respects modes, precedences and both types of resources.
+    It stops at the first violation found. The cheapest checks go first.
+    jobs needs to contain every job exactly once.
+    """
+    if not arrays.mode_mask[jobs, modes].all():
+        return False
+    # start and finish times by job position
+    start = np.empty(arrays.n_jobs, dtype=np.int64)
+    start[jobs] = starts
+    finish = np.empty(arrays.n_jobs, dtype=np.int64)
+    finish[jobs] = starts + arrays.durations[jobs, modes]
+    before, after = arrays.arcs
+    if (finish[before] > start[after]).any():
+        return False
+    non_renewable = ~arrays.renewable
+    used = arrays.needs[jobs, modes][:, non_renewable].sum(axis=0)
+    if (used > arrays.availability[non_renewable]).any():
+        return False
+    offset = min(0, int(start.min()))
+    periods = int(finish.max()) - offset
+    usage = get_renewable_usage(arrays, jobs, modes, starts - offset, periods)
+    return not (usage > arrays.availability[arrays.renewable][:, None]).any()
+
+
+def evaluate_batch(arrays, modes: np.ndarray, starts: np.ndarray) -> dict:
+    """
+    Evaluates many schedules of the same instance at once.
+    Each row of modes and starts is one candidate, with one column per job,
+    aligned with arrays.jobs.
+
+    :param arrays: InstanceArrays
+    :param modes: positions of the modes (candidates x jobs).
+        -1 can be used for a mode that does not exist.
+    :param starts: start times (candidates x jobs)
+    :return: a dictionary of arrays with one value per candidate:
+        makespan, modes (jobs in a mode they do not have),
+        successors (arcs that are not respected),
+        resources_nr and resources_r (total excess over the availability,
+        summed over resources and, for renewable resources, over periods).
+    """
+    n_candidates, n_jobs = starts.shape
+    jobs = np.arange(n_jobs)
+    known = modes >= 0
+    modes = np.where(known, modes, 0)
+    wrong_modes = (~(known & arrays.mode_mask[jobs, modes])).sum(axis=1)
+    finishes = starts + arrays.durations[jobs, modes]
+    makespan = finishes.max(axis=1)
+    before, after = arrays.arcs
+    successors = (finishes[:, before] > starts[:, after]).sum(axis=1)
+
+    needs = arrays.needs[jobs, modes]
+    non_renewable = ~arrays.renewable
+    used = needs[:, :, non_renewable].sum(axis=1)
+    excess = used - arrays.availability[non_renewable]
+    resources_nr = np.maximum(excess, 0).sum(axis=1)
+
+    # one difference array per candidate and renewable resource, flattened
+    # so np.bincount can fill all of them in a single call
+    needs = needs[:, :, arrays.renewable]
+    n_resources = needs.shape[2]
+    offset = min(0, int(starts.min()))
+    periods = int(makespan.max()) - offset + 1
+    profile = (
+        np.arange(n_candidates)[:, None, None] * n_resources
+        + np.arange(n_resources)[None, None, :]
+    ) * periods
+    index = np.concatenate(
+        [
+            (profile + (starts - offset)[:, :, None]).ravel(),
+            (profile + (finishes - offset)[:, :, None]).ravel(),
+        ]
+    )
+    weights = np.concatenate([needs.ravel(), -needs.ravel()])
+    diff = np.bincount(
+        index, weights=weights, minlength=n_candidates * n_resources * periods
+    )
+    usage = np.cumsum(diff.reshape(n_candidates, n_resources, periods), axis=2)
+    excess = usage - arrays.availability[arrays.renewable][None, :, None]
+    resources_r = np.maximum(excess, 0).sum(axis=(1, 2)).astype(np.int64)
+
+    return dict(
+        makespan=makespan,
+        modes=wrong_modes,
+        successors=successors,
+        resources_nr=resources_nr,
+        resources_r=resources_r,
+    )
@@ -3,16 +3,34 @@ import os
 from .instance import Instance
 from .solution import Solution
 from . import tools as di
+from . import evaluation
+import numpy as np
+import posixpath
 from zipfile import ZipFile
-from typing import List, Tuple
+from typing import List, Tuple, Sequence
 from cornflow_client import ExperimentCore
 from cornflow_client.core.tools import load_json
 
+# experiments can point to an instance stored once for the whole batch,
+# in batch/INSTANCES_DIR/<hash>.json, instead of having their own input.json.
+# The reference has the path of the instance relative to the experiment.
+INSTANCES_DIR = "_instances"
+INSTANCE_REF = "input_ref.json"
+
+# status returned by Experiment.solve (the codes of ortools and of the milp solvers)
+STATUS_UNKNOWN = 0
+STATUS_FEASIBLE = 2
+STATUS_INFEASIBLE = 3
+STATUS_OPTIMAL = 4
+
 
 class Experiment(ExperimentCore):
     schema_checks = load_json(
         os.path.join(os.path.dirname(__file__), "../schemas/solution_checks.json")
     )
+    # if given, it is called with every solution assigned to the experiment
+    # (run_batch.solve_supervised uses it to keep the last solution of a solver)
+    solution_callback = None
 
     def __init__(self, instance: Instance, solution: Solution):
         super().__init__(instance, solution)
@@ -25,11 +43,71 @@ class Experiment(ExperimentCore):
     def instance(self) -> Instance:
         return self._instance
 
+    @property
+    def solution(self) -> Solution:
+        return self._solution
+
+    @solution.setter
+    def solution(self, value: Solution):
+        self._solution = value
+        self.clear_cache()
+        if value is not None and self.solution_callback is not None:
+            self.solution_callback(value)
+
+    def clear_cache(self) -> None:
+        """
+        Forgets the views of the solution (start times, modes, makespan...).
+        They are recalculated when the solution or its data are assigned, or
+        when it changes with Solution.set_assignment or remove_assignment.
+        After editing solution.data in place (solution.data[job]["period"] = 1)
+        the views are stale until this is called.
+        """
+        self._cache = {}
+        self._cache_version = None
+
+    def _get_cached(self, key: str, func):
+        version = getattr(self.solution, "version", None)
+        if version != self._cache_version:
+            self._cache = {}
+            self._cache_version = version
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    def _get_schedule(self) -> Tuple[pt.SuperDict, pt.SuperDict]:
+        # start times and modes in a single pass over the solution
+        return self._get_cached("schedule", self._read_schedule)
+
+    def _read_schedule(self) -> Tuple[pt.SuperDict, pt.SuperDict]:
+        starts = pt.SuperDict()
+        modes = pt.SuperDict()
+        for job, assignment in self.solution.data.items():
+            # as SuperDict.get_property, jobs without the key are left out
+            if "period" in assignment:
+                starts[job] = assignment["period"]
+            if "mode" in assignment:
+                modes[job] = assignment["mode"]
+        return starts, modes
+
     @classmethod
     def from_json(
-        cls, path: str, inst_file: str = "input.json", sol_file: str = "output.json"
+        cls,
+        path: str,
+        inst_file: str = "input.json",
+        sol_file: str = "output.json",
+        instances: dict = None,
     ) -> "Experiment":
-        instance = Instance.from_json(os.path.join(path, inst_file))
+        """
+        :param instances: {path: Instance} with the shared instances already
+            read. It is updated with the new ones.
+        """
+        inst_path = os.path.join(path, inst_file)
+        ref = di.load_data(os.path.join(path, INSTANCE_REF))
+        if not os.path.exists(inst_path) and ref:
+            inst_path = os.path.normpath(os.path.join(path, ref["path"]))
+            instance = cls._get_shared(instances, inst_path, Instance.from_json)
+        else:
+            instance = Instance.from_json(inst_path)
         if os.path.exists(os.path.join(path, sol_file)):
             solution = Solution.from_json(os.path.join(path, sol_file))
         else:
@@ -43,9 +121,26 @@ class Experiment(ExperimentCore):
         path: str,
         inst_file: str = "input.json",
         sol_file: str = "output.json",
+        instances: dict = None,
     ) -> "Experiment":
+        """
+        :param instances: {path: Instance} with the shared instances already
+            read. It is updated with the new ones.
+        """
         instance = di.load_data_zip(zipobj, os.path.join(path, inst_file))
-        instance = Instance.from_dict(instance)
+        if instance:
+            instance = Instance.from_dict(instance)
+        else:
+            ref = di.load_data_zip(zipobj, posixpath.join(path, INSTANCE_REF))
+            if not ref:
+                message = "{} has no {} nor {} in the zip"
+                raise FileNotFoundError(message.format(path, inst_file, INSTANCE_REF))
+            inst_path = posixpath.normpath(posixpath.join(path, ref["path"]))
+            instance = cls._get_shared(
+                instances,
+                inst_path,
+                lambda p: Instance.from_dict(di.load_data_zip(zipobj, p)),
+            )
         try:
             solution = di.load_data_zip(zipobj, os.path.join(path, sol_file))
             solution = Solution.from_dict(solution)
@@ -53,6 +148,14 @@ class Experiment(ExperimentCore):
             solution = None
         return cls(instance, solution)
 
+    @staticmethod
+    def _get_shared(instances: dict, path: str, read) -> Instance:
+        if instances is None:
+            return read(path)
+        if path not in instances:
+            instances[path] = read(path)
+        return instances[path]
+
     def solve(self, options: dict):
         raise NotImplementedError("complete this!")
 
@@ -68,6 +171,66 @@ class Experiment(ExperimentCore):
         result = {k: func_list[k](**params) for k in list_tests}
         return pt.SuperDict({k: v for k, v in result.items() if v})
 
+    def is_feasible(
+        self, starts: Sequence[int] = None, modes: Sequence[int] = None
+    ) -> bool:
+        """
+        Fast version of `not check_solution()`: it stops at the first violation
+        and does not build the error records.
+
+        :param starts: start times, aligned with instance.arrays.jobs.
+            If not given, the current solution is checked.
+        :param modes: modes (the same ids as in the solution), aligned with starts.
+        :return: True if all the checks pass.
+        """
+        arrays = self.instance.arrays
+        if starts is None:
+            if self.solution.data.keys() != arrays.job_index.keys():
+                return False
+            jobs, mode_positions, starts = self.get_solution_positions()
+            return evaluation.is_feasible(arrays, jobs, mode_positions, starts)
+        starts = np.asarray(starts, dtype=np.int64)
+        modes = np.asarray(modes, dtype=np.int64)
+        if len(starts) != arrays.n_jobs or len(modes) != arrays.n_jobs:
+            return False
+        mode_positions = np.searchsorted(arrays.modes, modes)
+        if (mode_positions >= len(arrays.modes)).any():
+            return False
+        if (np.asarray(arrays.modes)[mode_positions] != modes).any():
+            return False
+        jobs = np.arange(arrays.n_jobs)
+        return evaluation.is_feasible(arrays, jobs, mode_positions, starts)
+
+    def evaluate_batch(self, starts, modes) -> pt.SuperDict:
+        """
+        Evaluates many candidate schedules for the instance in one go.
+        The current solution is not used.
+
+        :param starts: start times, one row per candidate, one column per job
+            (aligned with instance.arrays.jobs).
+        :param modes: modes (the same ids as in the solution), aligned with starts.
+        :return: for each measure, an array with one value per candidate:
+            makespan, modes (jobs in a mode they do not have),
+            successors (precedences not respected), resources_nr and resources_r
+            (units of resource above the availability, summed over the periods
+            for renewable resources).
+            A candidate is feasible if all the measures but makespan are zero.
+        """
+        arrays = self.instance.arrays
+        starts = np.atleast_2d(np.asarray(starts, dtype=np.int64))
+        modes = np.atleast_2d(np.asarray(modes, dtype=np.int64))
+        if starts.shape != modes.shape or starts.shape[1] != arrays.n_jobs:
+            raise ValueError(
+                "starts and modes need one column per job, got {} and {}".format(
+                    starts.shape, modes.shape
+                )
+            )
+        ids = np.asarray(arrays.modes)
+        mode_positions = np.minimum(np.searchsorted(ids, modes), len(ids) - 1)
+        mode_positions[ids[mode_positions] != modes] = -1
+        result = evaluation.evaluate_batch(arrays, mode_positions, starts)
+        return pt.SuperDict(result)
+
     def check_successors(self, **params) -> pt.TupList:
         """
         Checks that a job finishes before any of its successors starts.
@@ -75,16 +238,8 @@ class Experiment(ExperimentCore):
         [{"job1": id_job1, "job2": id_job2, "difference": time_difference}, ...]
         """
         succ = self.instance.data["jobs"].get_property("successors")
-        durations = self.instance.data["durations"]
-        solution = (
-            self.solution.data.to_dictup()
-            .to_tuplist()
-            .to_dict(result_col=2, indices=[1, 0], is_list=False)
-            .to_dictdict()
-        )
-        sol_start = solution.get("period", pt.SuperDict())
-        sol_mode = solution.get("mode", pt.SuperDict())
-        sol_finished = sol_start.kvapply(lambda k, v: v + durations[k][sol_mode[k]])
+        sol_start = self.get_start_times()
+        sol_finished = self.get_finished_times()
         errors = pt.TupList()
         for job, post_jobs in succ.items():
             if job not in sol_finished:
@@ -109,9 +264,7 @@ class Experiment(ExperimentCore):
         [{"resource": id_resource, "quantity": excess}, ...]
         """
         # non renewables are counted once per job
-        sol_mode = self.get_modes()
-        usage = self.instance.data["needs"]
-        resource_usage = sol_mode.kvapply(lambda k, v: usage[k][v])
+        resource_usage = self.get_resource_usage()
         avail = self.instance.data["resources"].get_property("available")
         renewable_res = self.instance.get_renewable_resources()
         resource_usage_N = (
@@ -131,38 +284,61 @@ class Experiment(ExperimentCore):
 
     def check_resources_renewable(self, **params) -> pt.TupList:
         """
-        Checks that the use of renewable resources never exceed the quantity available at each period
+        Checks that the use of renewable resources never exceed the quantity available
+        at each period
         Returns a tuplist with format:
         [{"resource": id_resource, "period": id_period, "quantity": quantity}, ...]
         """
-        sol_mode = self.get_modes()
-        usage = self.instance.data["needs"]
-        resource_usage = sol_mode.kvapply(lambda k, v: usage[k][v])
-        avail = self.instance.data["resources"].get_property("available")
-        renewable_res = self.instance.get_renewable_resources()
-        sol_start = self.get_start_times()
-        sol_finished = self.get_finished_times()
-        job_periods = sol_start.sapply(func=range, other=sol_finished)
-        makespan = self.get_objective()
-        consumption_rt = pt.SuperDict(
-            {(r, t): 0 for r in renewable_res for t in range(makespan + 1)}
+        arrays = self.instance.arrays
+        jobs, modes, starts = self.get_solution_positions()
+        # periods go from the first start (0 if possible) to the makespan
+        offset = min(0, int(starts.min())) if len(starts) else 0
+        periods = self.get_objective() + 1 - offset
+        usage = evaluation.get_renewable_usage(
+            arrays, jobs, modes, starts - offset, periods
         )
-        for job, periods in job_periods.items():
-            for period in periods:
-                # print(period)
-                # print(job)
-                for resource, value in resource_usage[job].items():
-                    if resource in renewable_res:
-                        consumption_rt[resource, period] += value
-        errors_R = (
-            consumption_rt.kvapply(lambda k, v: avail[k[0]] - v)
-            .vfilter(lambda v: v < 0)
-            .to_tuplist()
-            .vapply(lambda v: {"resource": v[0], "period": v[1], "quantity": v[2]})
+        renewable_res = [r for r, v in zip(arrays.resources, arrays.renewable) if v]
+        excess = arrays.availability[arrays.renewable][:, None] - usage
+        errors_R = pt.TupList(
+            {
+                "resource": renewable_res[r],
+                "period": int(t) + offset,
+                "quantity": int(q),
+            }
+            for r, t, q in zip(*np.nonzero(excess < 0), excess[excess < 0])
         )
         return errors_R
 
+    def get_solution_positions(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The solution as arrays of positions in instance.arrays.
+        The arrays are shared between calls: they are read-only.
+
+        :return: jobs, modes and start times
+        """
+        return self._get_cached("positions", self._read_solution_positions)
+
+    def _read_solution_positions(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        arrays = self.instance.arrays
+        sol_start, sol_mode = self._get_schedule()
+        size = len(sol_start)
+        jobs = np.fromiter(
+            (arrays.job_index[j] for j in sol_start), dtype=np.int64, count=size
+        )
+        modes = np.fromiter(
+            (arrays.mode_index[m] for m in sol_mode.values()),
+            dtype=np.int64,
+            count=size,
+        )
+        starts = np.fromiter(sol_start.values(), dtype=np.int64, count=size)
+        for array in (jobs, modes, starts):
+            array.flags.writeable = False
+        return jobs, modes, starts
+
     def get_objective(self, **params) -> int:
+        return self._get_cached("makespan", self._read_objective)
+
+    def _read_objective(self) -> int:
         finished_time = self.get_finished_times().values()
         if not len(finished_time):
             return 0
@@ -177,23 +353,35 @@ class Experiment(ExperimentCore):
         """
         for each job, returns the start period
         """
-        return self.solution.data.get_property("period")
+        return self._get_schedule()[0]
 
     def get_modes(self) -> pt.SuperDict[int, int]:
         """
         for each job, returns the mode of execution
         """
-        return self.solution.data.get_property("mode")
+        return self._get_schedule()[1]
 
     def get_finished_times(self) -> pt.SuperDict[int, int]:
         """
         for each job, returns the end period
         """
-        sol_start = self.get_start_times()
-        sol_mode = self.solution.data.get_property("mode")
+        return self._get_cached("finishes", self._read_finished_times)
+
+    def _read_finished_times(self) -> pt.SuperDict[int, int]:
+        sol_start, sol_mode = self._get_schedule()
         durations = self.instance.data["durations"]
         return sol_start.kvapply(lambda k, v: v + durations[k][sol_mode[k]])
 
+    def get_resource_usage(self) -> pt.SuperDict:
+        """
+        for each job, returns the needs of its mode: {job: {resource: quantity}}
+        """
+        return self._get_cached("usage", self._read_resource_usage)
+
+    def _read_resource_usage(self) -> pt.SuperDict:
+        usage = self.instance.data["needs"]
+        return self.get_modes().kvapply(lambda k, v: usage[k][v])
+
     def graph(self):
         try:
             import plotly as pt
@@ -228,7 +416,9 @@ class Experiment(ExperimentCore):
             width=2000,
             height=1000,
         )
-        # fig = px.timeline(gantt_data, x_start="Start", x_end="Finish", y="Task", color='Mode')
+        # fig = px.timeline(
+        #     gantt_data, x_start="Start", x_end="Finish", y="Task", color='Mode'
+        # )
         # fig.update_xaxes()
         fig = ff.create_gantt(gantt_data, colors=colors, index_col="Task", **options)
         fig["layout"].update(
@@ -251,6 +441,10 @@ class Experiment(ExperimentCore):
         #     for j in :
         #         :
         #             y_pos = (j['y'][0] + j['y'][1] + j['y'][2] + j['y'][3]) / 4
-        #         fig['layout']['annotations'] += tuple([dict(x=x_pos, y=y_pos, text=i['Label'], font={'color':'black'})])
+        #         fig['layout']['annotations'] += tuple([dict(
+        #             x=x_pos, y=y_pos, text=i['Label'], font={'color':'black'}
+        #         )])
 
-        # pt.offline.plot(fig, filename=filename, show_link=False, config=dict(responsive=True))
+        # pt.offline.plot(
+        #     fig, filename=filename, show_link=False, config=dict(responsive=True)
+        # )
@@ -0,0 +1,119 @@
+import pytups as pt
+from collections import deque
+from typing import List, Tuple
+
+
+class PrecedenceGraph(object):
+    """
+    Facts about the precedence graph of an instance that only depend on the input data.
+
+    * topological_order: job ids, every job before its successors.
+    * predecessors: for each job, the jobs that list it as a successor.
+    * closure: for each job, a bitset (python int) with all the jobs that come
+        after it, directly or not. Bit k corresponds to the job in position k of
+        topological_order.
+    * min_duration / max_duration: per job, over the executable modes
+        (modes whose needs all fit in the availability of the resources).
+    * horizon: an upper bound of the optimal makespan: all jobs, one after another,
+        in their longest executable mode.
+    * earliest_start / latest_start: time windows from a critical path pass with the
+        minimum durations and the horizon.
+    """
+
+    def __init__(self, instance):
+        data = instance.data
+        successors = data["jobs"].get_property("successors")
+        jobs = self.jobs = sorted(successors.keys())
+        self.successors = successors.vapply(pt.TupList)
+        self.predecessors = pt.SuperDict({j: pt.TupList() for j in jobs})
+        for job in jobs:
+            for successor in successors[job]:
+                self.predecessors[successor].append(job)
+        self.topological_order = self._topological_order(jobs)
+        self.position = pt.SuperDict(
+            {j: k for k, j in enumerate(self.topological_order)}
+        )
+        self.closure = self._closure()
+
+        available = data["resources"].get_property("available")
+        needs = data["needs"]
+
+        def executable(job, mode):
+            return all(v <= available[r] for r, v in needs[job][mode].items())
+
+        durations = data["durations"].kvapply(
+            lambda j, modes: {m: d for m, d in modes.items() if executable(j, m)}
+            or modes
+        )
+        self.min_duration = pt.SuperDict({j: min(durations[j].values()) for j in jobs})
+        self.max_duration = pt.SuperDict({j: max(durations[j].values()) for j in jobs})
+        self.horizon = sum(self.max_duration.values())
+        self.earliest_start, self.latest_start = self.get_time_windows(self.horizon)
+
+    def _topological_order(self, jobs: List[int]) -> pt.TupList:
+        remaining = pt.SuperDict({j: len(self.predecessors[j]) for j in jobs})
+        ready = deque(j for j in jobs if not remaining[j])
+        order = pt.TupList()
+        while ready:
+            job = ready.popleft()
+            order.append(job)
+            for successor in self.successors[job]:
+                remaining[successor] -= 1
+                if not remaining[successor]:
+                    ready.append(successor)
+        if len(order) != len(jobs):
+            raise ValueError("The precedence graph has a cycle")
+        return order
+
+    def _closure(self) -> pt.SuperDict:
+        closure = pt.SuperDict()
+        for job in reversed(self.topological_order):
+            bits = 0
+            for successor in self.successors[job]:
+                bits |= closure[successor] | (1 << self.position[successor])
+            closure[job] = bits
+        return pt.SuperDict({j: closure[j] for j in self.jobs})
+
+    def is_after(self, job: int, other: int) -> bool:
+        """
+        True if job needs to wait (directly or not) for other to finish.
+        """
+        return bool(self.closure[other] >> self.position[job] & 1)
+
+    def count_all_successors(self) -> pt.SuperDict:
+        """
+        For each job, the number of jobs that come after it (directly or not).
+        """
+        return self.closure.vapply(lambda v: bin(v).count("1"))
+
+    def get_time_windows(self, horizon: int) -> Tuple[pt.SuperDict, pt.SuperDict]:
+        """
+        Forward and backward critical path passes with the minimum durations.
+        Any schedule that ends before horizon starts each job inside its window.
+
+        :param horizon: maximum makespan allowed
+        :return: earliest start and latest start for each job
+        """
+        duration = self.min_duration
+        earliest = pt.SuperDict()
+        for job in self.topological_order:
+            earliest[job] = max(
+                (earliest[p] + duration[p] for p in self.predecessors[job]), default=0
+            )
+        latest = pt.SuperDict()
+        for job in reversed(self.topological_order):
+            finish = min((latest[s] for s in self.successors[job]), default=horizon)
+            latest[job] = finish - duration[job]
+        # we keep the jobs sorted by id
+        earliest = pt.SuperDict({j: earliest[j] for j in self.jobs})
+        latest = pt.SuperDict({j: latest[j] for j in self.jobs})
+        return earliest, latest
+
+    def get_critical_path_length(self) -> int:
+        """
+        A lower bound of the makespan: the longest path with the minimum durations.
+        """
+        return max(
+            self.earliest_start[j] + self.min_duration[j]
+            for j in self.topological_order
+        )
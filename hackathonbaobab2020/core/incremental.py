@@ -0,0 +1,161 @@
+import numpy as np
+import pytups as pt
+from .instance import Instance
+from .solution import Solution
+
+
+class IncrementalEvaluator(object):
+    """
+    Keeps a complete schedule and its violations up to date while jobs are moved
+    or change mode, so local search does not need to check the solution again.
+
+    It keeps the usage profile of the renewable resources, the totals of the
+    non-renewable resources and the slack of every precedence arc
+    (start of the successor minus finish of the predecessor,
+    aligned with instance.arrays.arcs).
+    A change only touches the periods the job leaves and occupies and the arcs
+    of the job.
+
+    Measures have the same names as in Experiment.evaluate_batch:
+    makespan, successors (arcs with negative slack), resources_nr and
+    resources_r (units above the availability).
+    Start times need to be non negative.
+    """
+
+    def __init__(self, instance: Instance, solution: Solution):
+        arrays = self.arrays = instance.arrays
+        data = solution.data
+        self.starts = arrays.to_positions(data.get_property("period"))
+        self.modes = arrays.to_positions(data.get_property("mode"), arrays.mode_index)
+        jobs = np.arange(arrays.n_jobs)
+        if not arrays.mode_mask[jobs, self.modes].all():
+            raise ValueError("The solution uses modes that the jobs do not have")
+        if (self.starts < 0).any():
+            raise ValueError("Start times need to be non negative")
+        self.finishes = self.starts + arrays.durations[jobs, self.modes]
+
+        # needs split by type of resource: (jobs x modes x resources)
+        self._needs_r = arrays.needs[:, :, arrays.renewable]
+        self._needs_nr = arrays.needs[:, :, ~arrays.renewable]
+        self._available_r = arrays.availability[arrays.renewable][:, None]
+        self._available_nr = arrays.availability[~arrays.renewable]
+
+        self.totals = self._needs_nr[jobs, self.modes].sum(axis=0)
+        self.resources_nr = self._get_excess_nr()
+        self.usage = np.zeros((len(self._available_r), 1), dtype=np.int64)
+        self.resources_r = 0
+        for job in jobs:
+            self.resources_r += self._add_job(job, 1)
+
+        before, after = arrays.arcs
+        self.slack = self.starts[after] - self.finishes[before]
+        self.successors = int((self.slack < 0).sum())
+        # the arcs where each job appears, as predecessor or successor
+        self._job_arcs = [
+            np.flatnonzero((before == job) | (after == job)) for job in jobs
+        ]
+        self._history = []
+
+    @property
+    def makespan(self) -> int:
+        return int(self.finishes.max())
+
+    def get_violations(self) -> pt.SuperDict:
+        return pt.SuperDict(
+            makespan=self.makespan,
+            successors=self.successors,
+            resources_nr=self.resources_nr,
+            resources_r=self.resources_r,
+        )
+
+    def is_feasible(self) -> bool:
+        return not (self.successors or self.resources_nr or self.resources_r)
+
+    def move(self, job: int, start: int) -> pt.SuperDict:
+        """
+        Changes the start time of a job.
+
+        :return: the change in each measure
+        """
+        position = self.arrays.job_index[job]
+        return self._apply(position, start, self.modes[position])
+
+    def set_mode(self, job: int, mode: int) -> pt.SuperDict:
+        """
+        Changes the mode of a job. The start time is kept.
+
+        :return: the change in each measure
+        """
+        position = self.arrays.job_index[job]
+        mode_position = self.arrays.mode_index.get(mode)
+        if mode_position is None or not self.arrays.mode_mask[position, mode_position]:
+            raise ValueError("Job {} does not have mode {}".format(job, mode))
+        return self._apply(position, self.starts[position], mode_position)
+
+    def undo(self) -> pt.SuperDict:
+        """
+        Reverts the last move or change of mode.
+
+        :return: the change in each measure
+        """
+        if not self._history:
+            raise IndexError("There is nothing to undo")
+        position, start, mode = self._history.pop()
+        return self._change(position, start, mode)
+
+    def get_solution(self) -> Solution:
+        arrays = self.arrays
+        data = pt.SuperDict(
+            {
+                job: pt.SuperDict(
+                    period=int(self.starts[i]), mode=arrays.modes[self.modes[i]]
+                )
+                for i, job in enumerate(arrays.jobs)
+            }
+        )
+        return Solution(data)
+
+    def _apply(self, position: int, start: int, mode: int) -> pt.SuperDict:
+        if start < 0:
+            raise ValueError("Start times need to be non negative")
+        self._history.append((position, self.starts[position], self.modes[position]))
+        return self._change(position, start, mode)
+
+    def _change(self, position: int, start: int, mode: int) -> pt.SuperDict:
+        previous = self.get_violations()
+        self.resources_r += self._add_job(position, -1)
+        self.totals -= self._needs_nr[position, self.modes[position]]
+        self.starts[position] = start
+        self.modes[position] = mode
+        self.finishes[position] = start + self.arrays.durations[position, mode]
+        self.totals += self._needs_nr[position, mode]
+        self.resources_nr = self._get_excess_nr()
+        self.resources_r += self._add_job(position, 1)
+
+        arcs = self._job_arcs[position]
+        before, after = self.arrays.arcs
+        self.successors -= int((self.slack[arcs] < 0).sum())
+        self.slack[arcs] = self.starts[after[arcs]] - self.finishes[before[arcs]]
+        self.successors += int((self.slack[arcs] < 0).sum())
+        return self.get_violations().kvapply(lambda k, v: v - previous[k])
+
+    def _get_excess_nr(self) -> int:
+        return int(np.maximum(self.totals - self._available_nr, 0).sum())
+
+    def _add_job(self, position: int, sign: int) -> int:
+        """
+        Adds (sign=1) or removes (sign=-1) a job from the renewable profile.
+
+        :return: the change in the excess of renewable resources
+        """
+        start, finish = self.starts[position], self.finishes[position]
+        if finish > self.usage.shape[1]:
+            # the profile grows at least twice its size to avoid copying it often
+            size = max(finish, 2 * self.usage.shape[1])
+            usage = np.zeros((self.usage.shape[0], size), dtype=np.int64)
+            usage[:, : self.usage.shape[1]] = self.usage
+            self.usage = usage
+        periods = self.usage[:, start:finish]
+        previous = np.maximum(periods - self._available_r, 0).sum()
+        periods += sign * self._needs_r[position, self.modes[position]][:, None]
+        return int(np.maximum(periods - self._available_r, 0).sum() - previous)
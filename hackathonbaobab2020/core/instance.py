@@ -1,9 +1,17 @@
 import pytups as pt
+import io
 import re
 from ..schemas import check_instance, instance
-from typing import List
+from typing import List, Iterable, Tuple
+from zipfile import ZipFile
 from cornflow_client import InstanceCore, get_empty_schema
 from pytups import SuperDict
+from .arrays import InstanceArrays
+from .graph import PrecedenceGraph
+
+# increase it every time the output of the .mm parser changes:
+# it invalidates the parsed instances stored in the cache.
+MM_PARSER_VERSION = 1
 
 
 class Instance(InstanceCore):
@@ -17,60 +25,55 @@ class Instance(InstanceCore):
     @data.setter
     def data(self, value: SuperDict):
         self._data = value
+        self._arrays = None
+        self._graph = None
+
+    @property
+    def arrays(self) -> InstanceArrays:
+        """
+        numpy view of the data (durations, needs, availability, successors).
+        It is built on first access and kept until data is replaced.
+        """
+        if self._arrays is None:
+            self._arrays = InstanceArrays(self)
+        return self._arrays
+
+    @property
+    def graph(self) -> PrecedenceGraph:
+        """
+        precedence graph index (topological order, predecessors, transitive closure,
+        time windows). It is built on first access and kept until data is replaced.
+        """
+        if self._graph is None:
+            self._graph = PrecedenceGraph(self)
+        return self._graph
 
     @classmethod
-    def from_mm(cls, path: str, content: List[str] = None) -> "Instance":
+    def from_mm(cls, path: str, content: Iterable[str] = None) -> "Instance":
+        """
+        Reads a PSPLIB multi-mode (.mm) file.
+
+        :param path: path to the .mm file. Only used if content is None.
+        :param content: any iterable of lines (a list, an open file or a text stream
+            of a zip member). Lines are consumed lazily, in one pass.
+        :return: the instance
+        """
         if content is None:
             with open(path, "r") as f:
-                content = f.readlines()
-
-        content = pt.TupList(content)
-        index_prec = content.index("PRECEDENCE RELATIONS:\n")
-
-        index_requests = content.index("REQUESTS/DURATIONS:\n")
-
-        index_avail = content.index("RESOURCEAVAILABILITIES:\n")
-
-        # precedence.
-        precedence = content[index_prec + 2 : index_requests - 1]
-        successors = pt.SuperDict()
-        for line in precedence:
-            _, job, modes, num_succ, *jobs, _ = re.split("\s+", line)
-            successors[int(job)] = pt.TupList(jobs).vapply(int)
-        successors = successors.kvapply(lambda k, v: dict(successors=v, id=k))
-
-        # requests/ durations
-        requests = content[index_requests + 3 : index_avail - 1]
-        resources = re.findall(r"[RN] \d", content[index_requests + 1])
-        needs = pt.SuperDict()
-        durations = pt.SuperDict()
-        last_job = ""
-        for line in requests:
-            if line[2] == " ":
-                job = last_job
-                _, mode, duration, *consumption, _ = re.split("\s+", line)
-            else:
-                _, job, mode, duration, *consumption, _ = re.split("\s+", line)
-                last_job = job
-            key = int(job), int(mode)
-            needs[key] = {v: int(consumption[k]) for k, v in enumerate(resources)}
-            needs[key] = pt.SuperDict(needs[key])
-            durations[key] = int(duration)
-
-        # resources / availabilities
-        line = content[index_avail + 2]
-        _, *avail, _ = re.split("\s+", line)
-        availability = {k: int(avail[i]) for i, k in enumerate(resources)}
-        availability = pt.SuperDict(availability).kvapply(
-            lambda k, v: dict(available=v, id=k)
-        )
-        data = dict(
-            resources=availability,
-            jobs=successors,
-            durations=durations.to_dictdict(),
-            needs=needs.to_dictdict(),
-        )
-        return cls(data)
+                return cls(_parse_mm(f))
+        return cls(_parse_mm(content))
+
+    @classmethod
+    def from_zip(cls, zip_obj: ZipFile, filename: str) -> "Instance":
+        """
+        Reads a .mm file stored inside a zip without extracting it first.
+
+        :param zip_obj: an open ZipFile
+        :param filename: the name of the member inside the zip
+        :return: the instance
+        """
+        with zip_obj.open(filename) as f:
+            return cls.from_mm(path=None, content=io.TextIOWrapper(f, encoding="utf-8"))
 
     def to_dict(self) -> dict:
 
@@ -121,6 +124,18 @@ class Instance(InstanceCore):
         )
         return cls(data)
 
+    def reduce(self) -> Tuple["Instance", "InstanceReduction"]:
+        """
+        Removes non-executable and inefficient modes, redundant non-renewable
+        resources and redundant precedences (see core.reduction.reduce_instance).
+
+        :return: the reduced instance and an InstanceReduction with the changes.
+            Use InstanceReduction.restore_solution to translate a solution back.
+        """
+        from .reduction import reduce_instance
+
+        return reduce_instance(self)
+
     @staticmethod
     def is_resource_renewable(resource: dict) -> bool:
         if "type" in resource:
@@ -129,3 +144,71 @@ class Instance(InstanceCore):
 
     def get_renewable_resources(self) -> List[str]:
         return self.data["resources"].vfilter(self.is_resource_renewable).keys_l()
+
+
+# states of the .mm parser
+_SKIP, _PRECEDENCE, _REQUESTS, _AVAILABILITY = range(4)
+
+
+def _parse_mm(lines: Iterable[str]) -> dict:
+    """
+    Single pass state machine over the lines of a .mm file.
+    Each section is detected by its title and ends with a line of asterisks.
+    """
+    jobs = {}
+    durations = {}
+    needs = {}
+    resources = []
+    availability = {}
+    state = _SKIP
+    # number of header lines to skip after a section title
+    skip = 0
+    last_job = None
+    for line in lines:
+        if skip:
+            skip -= 1
+            if state == _REQUESTS and not resources:
+                # the first line after the title has the resources names
+                resources = re.findall(r"[RN] \d+", line)
+            continue
+        if line.startswith("*"):
+            state = _SKIP
+            continue
+        if state == _SKIP:
+            if line.startswith("PRECEDENCE RELATIONS:"):
+                state, skip = _PRECEDENCE, 1
+            elif line.startswith("REQUESTS/DURATIONS:"):
+                state, skip = _REQUESTS, 2
+            elif line.startswith("RESOURCEAVAILABILITIES:"):
+                state, skip = _AVAILABILITY, 1
+            continue
+        values = line.split()
+        if not values:
+            continue
+        if state == _PRECEDENCE:
+            job = int(values[0])
+            successors = pt.TupList(int(v) for v in values[3:])
+            jobs[job] = dict(successors=successors, id=job)
+        elif state == _REQUESTS:
+            if len(values) > len(resources) + 2:
+                last_job = int(values[0])
+                values = values[1:]
+                durations[last_job] = {}
+                needs[last_job] = {}
+            mode, duration, *consumption = values
+            mode = int(mode)
+            durations[last_job][mode] = int(duration)
+            needs[last_job][mode] = {
+                r: int(consumption[i]) for i, r in enumerate(resources)
+            }
+        elif state == _AVAILABILITY:
+            availability = {
+                r: dict(available=int(values[i]), id=r) for i, r in enumerate(resources)
+            }
+            state = _SKIP
+    return dict(
+        resources=availability,
+        jobs=jobs,
+        durations=durations,
+        needs=needs,
+    )
@@ -0,0 +1,177 @@
+import pytups as pt
+from .solution import Solution
+
+
+class InstanceReduction(object):
+    """
+    Result of Instance.reduce().
+    It keeps what was removed and how to translate solutions of the reduced
+    instance back to the original one.
+
+    * modes: {job: {reduced_mode: original_mode}}. Modes are renumbered 1, 2, ...
+    * removed_modes: TupList of (job, original_mode).
+    * removed_resources: non-renewable resources that can never be binding.
+    * removed_arcs: TupList of (job, successor) implied by other precedences.
+    """
+
+    def __init__(self, modes, removed_modes, removed_resources, removed_arcs):
+        self.modes = modes
+        self.removed_modes = removed_modes
+        self.removed_resources = removed_resources
+        self.removed_arcs = removed_arcs
+
+    def restore_solution(self, solution: Solution) -> Solution:
+        """
+        :param solution: a solution of the reduced instance
+        :return: the same solution for the original instance
+        """
+        data = solution.data.kvapply(
+            lambda k, v: pt.SuperDict(period=v["period"], mode=self.modes[k][v["mode"]])
+        )
+        return Solution(data)
+
+    def get_summary(self) -> pt.SuperDict:
+        return pt.SuperDict(
+            modes=len(self.removed_modes),
+            resources=len(self.removed_resources),
+            arcs=len(self.removed_arcs),
+        )
+
+
+def reduce_instance(instance):
+    """
+    Classic MRCPSP preprocessing (Sprecher, Hartmann and Drexl, 1997):
+
+    1. non-executable modes: a renewable need above the availability, or a
+        non-renewable need that does not fit even if every other job uses its
+        cheapest mode.
+    2. redundant non-renewable resources: the sum of the maximum needs fits.
+    3. inefficient modes: another mode of the same job is not longer and
+        does not need more of any resource.
+
+    The three steps are repeated until nothing changes. Finally, arcs that are
+    implied by other precedences are removed.
+    A job always keeps at least one mode.
+
+    :return: the reduced instance and the InstanceReduction to go back
+    """
+    data = instance.data
+    available = data["resources"].get_property("available")
+    renewable = set(instance.get_renewable_resources())
+    durations = data["durations"].vapply(lambda v: dict(v))
+    needs = data["needs"]
+    resources = set(data["resources"].keys())
+    removed_modes = pt.TupList()
+
+    def remove_modes(func):
+        changed = False
+        for job, modes in durations.items():
+            remove = [m for m in modes if func(job, m)]
+            if len(remove) == len(modes):
+                # a job without modes would make the instance unusable
+                continue
+            for mode in remove:
+                modes.pop(mode)
+                removed_modes.append((job, mode))
+                changed = True
+        return changed
+
+    def min_need(job, resource):
+        return min(needs[job][m][resource] for m in durations[job])
+
+    def non_executable(job, mode):
+        for resource in resources:
+            need = needs[job][mode][resource]
+            if resource in renewable:
+                if need > available[resource]:
+                    return True
+                continue
+            others = total_min_need[resource] - min_need(job, resource)
+            if need + others > available[resource]:
+                return True
+        return False
+
+    def inefficient(job, mode):
+        for other in durations[job]:
+            if other == mode:
+                continue
+            dominates = durations[job][other] <= durations[job][mode] and all(
+                needs[job][other][r] <= needs[job][mode][r] for r in resources
+            )
+            if not dominates:
+                continue
+            # identical modes: we keep the first one
+            equal = durations[job][other] == durations[job][mode] and all(
+                needs[job][other][r] == needs[job][mode][r] for r in resources
+            )
+            if not equal or other < mode:
+                return True
+        return False
+
+    def redundant_resources():
+        return [
+            r
+            for r in resources
+            if r not in renewable
+            and sum(max(needs[j][m][r] for m in durations[j]) for j in durations)
+            <= available[r]
+        ]
+
+    changed = True
+    while changed:
+        total_min_need = {
+            r: sum(min_need(j, r) for j in durations)
+            for r in resources
+            if r not in renewable
+        }
+        changed = remove_modes(non_executable)
+        redundant = redundant_resources()
+        resources -= set(redundant)
+        changed = remove_modes(inefficient) or changed or bool(redundant)
+
+    # precedence: an arc (i, j) is redundant if j comes after another successor of i
+    graph = instance.graph
+    successors = graph.successors
+    removed_arcs = pt.TupList()
+    new_successors = pt.SuperDict()
+    for job, post_jobs in successors.items():
+        keep = pt.TupList()
+        for successor in post_jobs:
+            implied = any(
+                graph.is_after(successor, other)
+                for other in post_jobs
+                if other != successor
+            )
+            if implied:
+                removed_arcs.append((job, successor))
+            else:
+                keep.append(successor)
+        new_successors[job] = keep
+
+    # modes are renumbered so each job has modes 1, 2, ...
+    modes_map = durations.vapply(
+        lambda modes: pt.SuperDict({k + 1: m for k, m in enumerate(sorted(modes))})
+    )
+    new_durations = modes_map.kvapply(
+        lambda j, modes: {k: durations[j][m] for k, m in modes.items()}
+    )
+    new_needs = modes_map.kvapply(
+        lambda j, modes: {
+            k: {r: v for r, v in needs[j][m].items() if r in resources}
+            for k, m in modes.items()
+        }
+    )
+    removed_resources = [r for r in data["resources"] if r not in resources]
+    new_data = dict(
+        resources=data["resources"].kfilter(lambda r: r in resources),
+        jobs=new_successors.kvapply(lambda k, v: dict(successors=v, id=k)),
+        durations=new_durations,
+        needs=new_needs,
+    )
+    reduction = InstanceReduction(
+        modes=modes_map,
+        removed_modes=removed_modes,
+        removed_resources=removed_resources,
+        removed_arcs=removed_arcs,
+    )
+    return type(instance)(new_data), reduction
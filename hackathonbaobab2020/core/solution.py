@@ -10,6 +10,10 @@ _solutionHint = Dict[str, List[Dict[str, int]]]
 
 class Solution(SolutionCore):
     schema = solution
+    # increases every time data is assigned or changed with set_assignment
+    # and remove_assignment, so views of the data can be cached
+    # (see Experiment.clear_cache for changes made to data in place).
+    version = 0
 
     def __init__(self, data: _solutionHint):
         """ """
@@ -25,6 +29,15 @@ class Solution(SolutionCore):
     @data.setter
     def data(self, value: SuperDict):
         self._data = value
+        self.version += 1
+
+    def set_assignment(self, job, period: int, mode: int) -> None:
+        self._data[job] = pt.SuperDict(period=period, mode=mode)
+        self.version += 1
+
+    def remove_assignment(self, job) -> None:
+        self._data.pop(job, None)
+        self.version += 1
 
     @classmethod
     def from_dict(cls, data_json: _solutionHint) -> "Solution":
@@ -55,6 +55,21 @@ def write_json(data: dict, path: str) -> None:
         json.dump(data, f, indent=4, sort_keys=True)
 
 
+def dump_json(data: dict) -> str:
+    """The same text write_json writes to a file"""
+    return json.dumps(data, indent=4, sort_keys=True)
+
+
+def write_text(content: str, path: str) -> None:
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def read_text(path: str) -> str:
+    with open(path, "r") as f:
+        return f.read()
+
+
 def parent_dirs(pathname: str, subdirs: set = None) -> set:
     """Return a set of all individual directories contained in a pathname
 
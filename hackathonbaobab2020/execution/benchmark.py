@@ -1,4 +1,4 @@
-from run_batch import solve_zip, get_table
+from run_batch import solve_zip, get_table, ResultZip
 import zipfile
 import random as rn
 import os
@@ -91,6 +91,8 @@ def solve_all():
         path_to_dir = path_out
         solver_name = solver
         zipfile_name = path_to_dir + ".zip"
+        # experiments are added to the zip as they finish
+        result_zip = ResultZip(zipfile_name, solver_name)
         for scenario in scenarios:
             solve_zip(
                 scenario,
@@ -98,11 +100,8 @@ def solve_all():
                 solver_name=solver_name,
                 instances=sampled_instances[scenario],
                 options=options,
+                result_zip=result_zip,
             )
-        base_dir = solver_name
-        if os.path.exists(zipfile_name):
-            os.remove(zipfile_name)
-        shutil.make_archive(path_to_dir, "zip", root_dir=root_dir, base_dir=base_dir)
 
 
 def compare():
@@ -0,0 +1,255 @@
+"""
+Micro benchmarks for the core of the package (parsing, checking).
+They only need the core dependencies.
+
+    python -m hackathonbaobab2020.execution.performance
+"""
+
+from hackathonbaobab2020.core import Instance, Experiment, Solution
+from hackathonbaobab2020.core.cache import InstanceCache, default_cache_dir
+from hackathonbaobab2020.solver import get_solver
+from hackathonbaobab2020.solver.milp_LP_HL.configuration import MAX_PERIOD
+import zipfile
+import os
+import numpy as np
+import pandas as pd
+import pytups as pt
+from glob import glob
+from timeit import default_timer as timer
+
+bundled_data = os.path.join(os.path.dirname(__file__), "../data/")
+
+
+def parse_throughput(
+    directory: str = bundled_data, repeat: int = 3, cache: InstanceCache = None
+) -> pd.DataFrame:
+    """
+    Parses every member of every zip in directory and measures the throughput.
+
+    :param directory: where the *.zip scenario files are
+    :param repeat: number of times each family is parsed. The best time is kept.
+    :param cache: if given, instances are read through this cache
+    :return: a table with one row per family
+    """
+    read = Instance.from_zip
+    if cache is not None:
+        read = cache.from_zip
+    rows = []
+    for path in sorted(glob(os.path.join(directory, "*.zip"))):
+        zip_obj = zipfile.ZipFile(path)
+        members = zip_obj.infolist()
+        size = sum(m.file_size for m in members)
+        best = float("inf")
+        for _ in range(repeat):
+            start = timer()
+            for member in members:
+                read(zip_obj, member.filename)
+            best = min(best, timer() - start)
+        rows.append(
+            dict(
+                family=os.path.basename(path),
+                instances=len(members),
+                megabytes=size / 1e6,
+                time=best,
+                instances_per_s=len(members) / best,
+                megabytes_per_s=size / 1e6 / best,
+            )
+        )
+    return pd.DataFrame(rows)
+
+
+def count_variables(instance: Instance) -> dict:
+    """
+    Number of variables each solver creates for an instance.
+    For the time indexed models the number of periods is the horizon of the
+    precedence graph (Iterator_HL starts with MAX_PERIOD periods and loop_EJ
+    grows its periods job by job, so the numbers are an estimate for them).
+    """
+    data = instance.data
+    jobs = len(data["jobs"])
+    resources = len(data["resources"])
+    renewable = len(instance.get_renewable_resources())
+    job_modes = sum(len(modes) for modes in data["durations"].values())
+    modes = len({m for modes in data["durations"].values() for m in modes})
+    periods = instance.graph.horizon
+
+    def milp(periods):
+        return (
+            3 * jobs * periods + job_modes + 3 * jobs + renewable * jobs * periods + 1
+        )
+
+    return dict(
+        ortools=4 * jobs + jobs * resources + 1,
+        Milp_LP_HL=milp(periods),
+        Iterator_HL=milp(MAX_PERIOD),
+        loop_EJ=2 * jobs * periods
+        + jobs * periods * modes
+        + jobs * modes
+        + resources
+        + 1,
+    )
+
+
+def reduction_savings(directory: str = bundled_data) -> pd.DataFrame:
+    """
+    Applies Instance.reduce to every instance of every zip in directory.
+
+    :return: a table with one row per family and solver with the removed modes,
+        resources and arcs and the variables before and after the reduction.
+    """
+    rows = []
+    for path in sorted(glob(os.path.join(directory, "*.zip"))):
+        zip_obj = zipfile.ZipFile(path)
+        totals = pd.DataFrame()
+        for filename in zip_obj.namelist():
+            instance = Instance.from_zip(zip_obj, filename)
+            reduced, reduction = instance.reduce()
+            before = count_variables(instance)
+            after = count_variables(reduced)
+            table = pd.DataFrame(
+                dict(
+                    solver=list(before.keys()),
+                    before=list(before.values()),
+                    after=list(after.values()),
+                    **reduction.get_summary(),
+                )
+            )
+            totals = pd.concat([totals, table])
+        totals = totals.groupby("solver").sum().reset_index()
+        totals.insert(0, "family", os.path.basename(path))
+        rows.append(totals)
+    table = pd.concat(rows, ignore_index=True)
+    table["saved"] = 1 - table["after"] / table["before"]
+    return table
+
+
+def _check_resources_renewable_loop(experiment: Experiment) -> pt.TupList:
+    """
+    The previous (dictionary based) renewable resource checker, for comparison.
+    """
+    sol_mode = experiment.get_modes()
+    usage = experiment.instance.data["needs"]
+    resource_usage = sol_mode.kvapply(lambda k, v: usage[k][v])
+    avail = experiment.instance.data["resources"].get_property("available")
+    renewable_res = experiment.instance.get_renewable_resources()
+    sol_start = experiment.get_start_times()
+    sol_finished = experiment.get_finished_times()
+    job_periods = sol_start.sapply(func=range, other=sol_finished)
+    makespan = experiment.get_objective()
+    consumption_rt = pt.SuperDict(
+        {(r, t): 0 for r in renewable_res for t in range(makespan + 1)}
+    )
+    for job, periods in job_periods.items():
+        for period in periods:
+            for resource, value in resource_usage[job].items():
+                if resource in renewable_res:
+                    consumption_rt[resource, period] += value
+    return (
+        consumption_rt.kvapply(lambda k, v: avail[k[0]] - v)
+        .vfilter(lambda v: v < 0)
+        .to_tuplist()
+        .vapply(lambda v: {"resource": v[0], "period": v[1], "quantity": v[2]})
+    )
+
+
+def renewable_check_scaling(
+    scales=(1, 10, 100, 1000), zip_name="c15.mm.zip", filename="c154_3.mm"
+) -> pd.DataFrame:
+    """
+    Times the renewable resource checker when the horizon grows.
+    The schedule of the default solver is stretched: every start time is
+    multiplied by the scale, so the number of periods grows with it.
+
+    :return: a table with the time of the previous loop and the vectorized checker
+    """
+    zip_obj = zipfile.ZipFile(os.path.join(bundled_data, zip_name))
+    instance = Instance.from_zip(zip_obj, filename)
+    experiment = get_solver("default")(instance)
+    experiment.solve({})
+    # the arrays are built once per instance: we leave them out of the timing
+    instance.arrays
+    rows = []
+    for scale in scales:
+        solution = experiment.solution.data.vapply(
+            lambda v: dict(period=v["period"] * scale, mode=v["mode"])
+        )
+        stretched = Experiment(instance, Solution(solution))
+        start = timer()
+        loop = _check_resources_renewable_loop(stretched)
+        middle = timer()
+        vectorized = stretched.check_resources_renewable()
+        end = timer()
+        assert loop == vectorized
+        rows.append(
+            dict(
+                scale=scale,
+                periods=stretched.get_objective(),
+                loop=middle - start,
+                vectorized=end - middle,
+                speedup=(middle - start) / (end - middle),
+            )
+        )
+    return pd.DataFrame(rows)
+
+
+def random_candidates(instance: Instance, size: int, seed: int = 0):
+    """
+    Random schedules for an instance: each job gets a random mode and a
+    random start time before the horizon.
+
+    :return: starts and modes, one row per candidate (see Experiment.evaluate_batch)
+    """
+    rng = np.random.default_rng(seed)
+    arrays = instance.arrays
+    durations = instance.data["durations"]
+    modes = np.array(
+        [[rng.choice(list(durations[j])) for j in arrays.jobs] for _ in range(size)],
+        dtype=np.int64,
+    ).reshape(size, arrays.n_jobs)
+    starts = rng.integers(0, instance.graph.horizon, size=(size, arrays.n_jobs))
+    return starts, modes
+
+
+def batch_check_scaling(
+    sizes=(1, 10, 100, 1000), zip_name="c15.mm.zip", filename="c154_3.mm"
+) -> pd.DataFrame:
+    """
+    Times Experiment.evaluate_batch against one check_solution per candidate.
+
+    :return: a table with the time of both for each number of candidates
+    """
+    zip_obj = zipfile.ZipFile(os.path.join(bundled_data, zip_name))
+    instance = Instance.from_zip(zip_obj, filename)
+    experiment = Experiment(instance, None)
+    jobs = instance.arrays.jobs
+    rows = []
+    for size in sizes:
+        starts, modes = random_candidates(instance, size)
+        start = timer()
+        for candidate_starts, candidate_modes in zip(starts.tolist(), modes.tolist()):
+            solution = {
+                j: dict(period=s, mode=m)
+                for j, s, m in zip(jobs, candidate_starts, candidate_modes)
+            }
+            Experiment(instance, Solution(solution)).check_solution()
+        middle = timer()
+        experiment.evaluate_batch(starts, modes)
+        end = timer()
+        rows.append(
+            dict(
+                candidates=size,
+                loop=middle - start,
+                batch=end - middle,
+                speedup=(middle - start) / (end - middle),
+            )
+        )
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    print(parse_throughput().to_string(index=False))
+    disk_cache = InstanceCache(default_cache_dir())
+    print(parse_throughput(cache=disk_cache).to_string(index=False))
+    print(reduction_savings().to_string(index=False))
+    print(renewable_check_scaling().to_string(index=False))
+    print(batch_check_scaling().to_string(index=False))
@@ -1,6 +1,22 @@
-from hackathonbaobab2020.core import Instance, ZipBatch
+from hackathonbaobab2020.core import Instance, Solution, ZipBatch
+from hackathonbaobab2020.core.batch import MANIFEST
+from hackathonbaobab2020.core.experiment import INSTANCES_DIR, INSTANCE_REF
+from hackathonbaobab2020.core.experiment import (
+    STATUS_UNKNOWN,
+    STATUS_FEASIBLE,
+    STATUS_INFEASIBLE,
+    STATUS_OPTIMAL,
+)
+from hackathonbaobab2020.core.cache import get_instance_cache
 import hackathonbaobab2020.core.tools as tools
-from hackathonbaobab2020.solver import get_solver
+from hackathonbaobab2020.solver import get_solver, justification
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import copy
+import hashlib
+import json
+import multiprocessing
+import signal
+import tempfile
 import zipfile
 import os
 import shutil
@@ -8,6 +24,18 @@ from timeit import default_timer as timer
 import logging as log
 from typing import List
 
+# status of a solve that was stopped by solve_supervised.
+# No solver returns it (cornflow uses -1 for infeasible).
+STATUS_TIMEOUT = -10
+
+STATUS_NAMES = {
+    STATUS_OPTIMAL: "Optimal",
+    STATUS_FEASIBLE: "Feasible",
+    STATUS_INFEASIBLE: "Infeasible",
+    STATUS_UNKNOWN: "Unknown",
+    STATUS_TIMEOUT: "Timeout",
+}
+
 
 def solve_zip(
     zip_name: str,
@@ -17,10 +45,44 @@ def solve_zip(
     test: bool = False,
     instances: List[str] = None,
     options: dict = None,
+    cache: bool = True,
+    reduce: bool = False,
+    workers: int = 1,
+    timeout: float = None,
+    resume: bool = False,
+    result_zip: "ResultZip" = None,
+    tree: bool = True,
+    share_instances: bool = True,
+    justify: bool = False,
 ) -> None:
-    if not os.path.exists(path_out):
-        os.mkdir(path_out)
-    batch_out_path = os.path.join(path_out, os.path.splitext(zip_name)[0])
+    """
+    Solves the instances of a scenario zip and writes one experiment
+    directory per instance in path_out/scenario/instance.
+    Each experiment is recorded in path_out/scenario/manifest.json as soon
+    as it finishes (see get_manifest_entry).
+
+    :param workers: number of processes. With more than one, each instance
+        is solved in a process of a pool.
+    :param timeout: if given, maximum time in seconds for each solve.
+        Each solve runs in a child process that is killed at the deadline
+        (see solve_supervised).
+    :param resume: if True, experiments that are in the manifest with the same
+        solver and options, without errors and not stopped at the timeout,
+        are not solved again.
+    :param result_zip: if given, each experiment is also added to it as soon
+        as it finishes. The manifest is added at the end.
+    :param tree: if False, nothing is written in path_out: the results
+        only go to result_zip.
+    :param share_instances: if True, each distinct instance is written once, in
+        path_out/_instances/<hash>.json, and experiments have a reference to it
+        (input_ref.json) instead of their own input.json.
+    :param justify: if True, the solution of each experiment is improved
+        with a forward-backward justification (see justification.justify).
+    """
+    if not tree and result_zip is None:
+        raise ValueError("Without the directory tree, a result_zip is needed")
+    scenario = os.path.splitext(zip_name)[0]
+    batch_out_path = os.path.join(path_out, scenario)
     if options is None:
         options = {}
     if options.get("DEBUG", False):
@@ -30,47 +92,452 @@ def solve_zip(
     # we recreate the whole batch output file
     # if os.path.exists(batch_out_path):
     #     shutil.rmtree(batch_out_path)
-    if not os.path.exists(batch_out_path):
-        os.mkdir(batch_out_path)
+    if tree:
+        if not os.path.exists(path_out):
+            os.mkdir(path_out)
+        if not os.path.exists(batch_out_path):
+            os.mkdir(batch_out_path)
 
     path = os.path.join(path_in, zip_name)
-    zip_obj = zipfile.ZipFile(path)
-    all_files = zip_obj.namelist()
+    with zipfile.ZipFile(path) as zip_obj:
+        all_files = zip_obj.namelist()
     if test:
         all_files = all_files[:3]
     if instances is not None:
         all_files = instances
-    solver = get_solver(solver_name)
-    # for each file:
-    for filename in all_files:
-        # filename = all_files[0]
-        experiment_dir = os.path.join(batch_out_path, filename)
+    tasks = [
+        dict(
+            zip_path=path,
+            filename=filename,
+            experiment_dir=os.path.join(batch_out_path, filename) if tree else None,
+            solver_name=solver_name,
+            options=options,
+            cache=cache,
+            reduce=reduce,
+            timeout=timeout,
+            return_files=result_zip is not None,
+            share_instance=share_instances,
+            justify=justify,
+        )
+        for filename in all_files
+    ]
+    manifest_path = os.path.join(batch_out_path, MANIFEST)
+    if tree:
+        manifest = tools.load_data(manifest_path) or {}
+    else:
+        manifest = result_zip.read_manifest(scenario)
+    # justify is only hashed when used, so older manifests are still valid
+    extra = dict(justify=True) if justify else {}
+    options_hash = get_options_hash(options, reduce=reduce, timeout=timeout, **extra)
+    if resume:
+        zipped = set()
+        if result_zip is not None:
+            zipped = result_zip.get_experiments(scenario)
+        pending = []
+        for task in tasks:
+            name = task["filename"]
+            if not is_finished(manifest.get(name), solver_name, options_hash):
+                pending.append(task)
+            elif tree and not os.path.isdir(task["experiment_dir"]):
+                pending.append(task)
+            elif result_zip is not None and name not in zipped:
+                if not tree:
+                    pending.append(task)
+                    continue
+                # finished in a run without the zip: we copy it from the tree
+                result_zip.copy_experiment(scenario, name, task["experiment_dir"])
+        tasks = pending
+
+    def record(task, summary):
+        manifest[task["filename"]] = get_manifest_entry(
+            solver_name, options_hash, summary
+        )
+        if tree:
+            write_manifest(manifest, manifest_path)
+        if result_zip is None:
+            return
+        if "instance" in summary:
+            result_zip.add_instance(*summary["instance"])
+        result_zip.add_experiment(scenario, task["filename"], summary["files"])
+
+    if workers <= 1:
+        for task in tasks:
+            record(task, solve_instance(**task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(solve_instance, **task): task for task in tasks}
+            for future in as_completed(futures):
+                # errors outside the solver are raised as in a sequential run
+                record(futures[future], future.result())
+    if result_zip is not None:
+        result_zip.write_manifest(scenario, manifest)
+
+
+def get_options_hash(options: dict, **kwargs) -> str:
+    """
+    Hash of everything that can change the result of an experiment
+    besides the solver: the options and the arguments of solve_zip in kwargs.
+    """
+    content = json.dumps(dict(options=options, **kwargs), sort_keys=True)
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def get_manifest_entry(solver_name: str, options_hash: str, summary: dict) -> dict:
+    """
+    :param summary: the result of solve_instance
+    :return: the manifest record of an experiment: solver, options_hash,
+        status, time and error (None if the solver did not fail)
+    """
+    return dict(
+        solver=solver_name,
+        options_hash=options_hash,
+        status=summary["status"],
+        time=summary["time"],
+        error=summary["error"],
+    )
+
+
+def is_finished(entry: dict, solver_name: str, options_hash: str) -> bool:
+    """
+    Experiments that failed or were stopped at the timeout are not finished.
+    """
+    if not entry:
+        return False
+    return (
+        entry["solver"] == solver_name
+        and entry["options_hash"] == options_hash
+        and entry["error"] is None
+        and entry["status"] != "Timeout"
+    )
+
+
+def write_manifest(manifest: dict, path: str) -> None:
+    # the manifest is the only record of a run: it should never be left half written
+    tmp_path = path + ".tmp"
+    tools.write_json(manifest, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def solve_instance(
+    zip_path: str,
+    filename: str,
+    experiment_dir: str = None,
+    solver_name: str = "default",
+    options: dict = None,
+    cache: bool = True,
+    reduce: bool = False,
+    timeout: float = None,
+    return_files: bool = False,
+    share_instance: bool = False,
+    justify: bool = False,
+) -> dict:
+    """
+    Solves one instance of a scenario zip and writes its experiment directory.
+    It is the unit of work of solve_zip: it only takes picklable arguments so
+    it can run in a worker process.
+
+    :param experiment_dir: where the files of the experiment are written.
+        If None, nothing is written to disk.
+    :param return_files: if True, the summary has the files of the experiment
+        in files: {name: content}. If the instance is shared, it also has
+        instance: (name, content).
+    :param share_instance: if True, the instance is written once for all the
+        experiments of the batch (see solve_zip).
+    :param justify: if True, the solution is improved after the solve
+        (see justification.justify).
+    :return: a summary of the experiment: status, time and error
+        (the message if the solver failed, None otherwise)
+    """
+    # solvers modify the options they get: each experiment gets its own copy
+    options = copy.deepcopy(options or {})
+    if experiment_dir is not None:
         if os.path.exists(experiment_dir):
             shutil.rmtree(experiment_dir)
         os.mkdir(experiment_dir)
-        data = zip_obj.read(filename)
-        inst = Instance.from_mm(path="", content=data.decode().splitlines(True))
+    with zipfile.ZipFile(zip_path) as zip_obj:
+        if cache:
+            inst = get_instance_cache().from_zip(zip_obj, filename)
+        else:
+            inst = Instance.from_zip(zip_obj, filename)
+    solver = get_solver(solver_name)
+    reduction = None
+    if reduce:
+        # we solve the reduced instance and translate the solution back
+        reduced, reduction = inst.reduce()
+        algo = solver(reduced)
+    else:
         algo = solver(inst)
-        start = timer()
-        try:
+    start = timer()
+    error = None
+    files = {}
+    try:
+        if timeout is None:
             status = algo.solve(options)
-        except Exception as e:
-            status = 0
-            with open(os.path.join(experiment_dir, "error.txt"), "w") as f:
-                f.write(str(e))
-
-        # export everything:
-        status_conv = {4: "Optimal", 2: "Feasible", 3: "Infeasible", 0: "Unknown"}
-        _log = dict(
-            time=timer() - start,
-            solver=solver_name,
-            status=status_conv.get(status, "Unknown"),
-        )
-        _log.update(options)
-        tools.write_json(_log, os.path.join(experiment_dir, "options.json"))
-        inst.to_json(os.path.join(experiment_dir, "input.json"))
-        if algo.solution is not None:
-            algo.solution.to_json(os.path.join(experiment_dir, "output.json"))
+        else:
+            with tempfile.TemporaryDirectory() as incumbent_dir:
+                incumbent_path = os.path.join(incumbent_dir, "incumbent.json")
+                status = solve_supervised(algo, options, timeout, incumbent_path)
+    except Exception as e:
+        status = 0
+        error = str(e)
+        files["error.txt"] = error
+    justified = False
+    if justify and error is None and algo.solution is not None:
+        justified = justification.justify(algo)
+    solution = algo.solution
+    if reduction is not None and solution is not None:
+        solution = reduction.restore_solution(solution)
+
+    # export everything:
+    _log = dict(
+        time=timer() - start,
+        solver=solver_name,
+        status=STATUS_NAMES.get(status, "Unknown"),
+    )
+    _log.update(options)
+    if justify:
+        _log["justified"] = justified
+    files["options.json"] = tools.dump_json(_log)
+    if share_instance:
+        # shared instances are stored without spaces: they are never read by hand
+        inst_content = json.dumps(inst.to_dict(), sort_keys=True, separators=(",", ":"))
+        inst_name = hashlib.sha1(inst_content.encode()).hexdigest() + ".json"
+        ref = dict(path="../../{}/{}".format(INSTANCES_DIR, inst_name))
+        files[INSTANCE_REF] = tools.dump_json(ref)
+    else:
+        files["input.json"] = tools.dump_json(inst.to_dict())
+    if solution is not None:
+        files["output.json"] = tools.dump_json(solution.to_dict())
+    if experiment_dir is not None:
+        for name, content in files.items():
+            tools.write_text(content, os.path.join(experiment_dir, name))
+        if share_instance:
+            store_instance(inst_name, inst_content, experiment_dir)
+    summary = dict(status=_log["status"], time=_log["time"], error=error)
+    if return_files:
+        summary["files"] = files
+        if share_instance:
+            summary["instance"] = (inst_name, inst_content)
+    return summary
+
+
+def store_instance(name: str, content: str, experiment_dir: str) -> None:
+    # experiment_dir is batch/scenario/instance
+    batch = os.path.dirname(os.path.dirname(os.path.normpath(experiment_dir)))
+    path = os.path.join(batch, INSTANCES_DIR)
+    inst_path = os.path.join(path, name)
+    if os.path.exists(inst_path):
+        return
+    os.makedirs(path, exist_ok=True)
+    # several workers can write the same instance at the same time
+    fd, tmp_path = tempfile.mkstemp(dir=path, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, inst_path)
+
+
+def solve_supervised(
+    experiment, options: dict, timeout: float, incumbent_path: str
+) -> int:
+    """
+    Runs experiment.solve(options) in a child process with a hard deadline.
+    The child starts a new process group, so at the deadline it is killed
+    together with any process it started (CBC, for example).
+
+    Every non empty solution the solver assigns is written to incumbent_path.
+    On a timeout, the last one is loaded back into the experiment.
+    Otherwise, the experiment gets the final solution and options get the
+    changes the solver made to them, as if it had been solved in this process.
+    If the final solution is empty, the last non empty one is kept.
+
+    :return: the status of the solver or STATUS_TIMEOUT
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_solve_child, args=(sender, experiment, options, incumbent_path)
+    )
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            _kill_group(process)
+            status = STATUS_TIMEOUT
+            if os.path.exists(incumbent_path):
+                experiment.solution = Solution.from_json(incumbent_path)
+            return status
+        try:
+            status, solution, child_options, error = receiver.recv()
+        except EOFError:
+            process.join()
+            raise RuntimeError(
+                "The solver process ended with exit code {}".format(process.exitcode)
+            )
+        process.join()
+        is_empty = solution is None or not solution.data
+        if is_empty and os.path.exists(incumbent_path):
+            solution = Solution.from_json(incumbent_path)
+    finally:
+        receiver.close()
+        if os.path.exists(incumbent_path):
+            os.remove(incumbent_path)
+    if error is not None:
+        raise RuntimeError(error)
+    options.clear()
+    options.update(child_options)
+    experiment.solution = solution
+    return status
+
+
+def _solve_child(sender, experiment, options: dict, incumbent_path: str) -> None:
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+    experiment.solution_callback = lambda solution: _write_incumbent(
+        solution, incumbent_path
+    )
+    try:
+        status = experiment.solve(options)
+        result = (status, experiment.solution, options, None)
+    except Exception as e:
+        result = (0, None, options, str(e))
+    sender.send(result)
+    sender.close()
+
+
+def _write_incumbent(solution: Solution, path: str) -> None:
+    # solvers can end with an empty solution: it never replaces the last one
+    if not solution.data:
+        return
+    # the parent can read the file at any moment: we write it and then rename it
+    tmp_path = path + ".tmp"
+    solution.to_json(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _kill_group(process: multiprocessing.Process) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        # no process groups (windows) or the child did not create it yet
+        process.kill()
+    process.join()
+
+
+class ResultZip(object):
+    """
+    Zip with the results of a batch, filled while the batch runs.
+    Members are root/scenario/instance/file, as ZipBatch expects.
+    Shared instances go to root/_instances/<hash>.json.
+    The zip is closed after each experiment, so the results that are already
+    in it can be read while the rest are being solved, and they are kept if
+    the batch is stopped. The names of the members are kept in memory, so
+    the zip is not listed again for each experiment.
+    """
+
+    def __init__(self, path: str, root: str):
+        self.path = path
+        self.root = root
+        self._names = set()
+        if os.path.exists(path):
+            with zipfile.ZipFile(path) as zip_obj:
+                self._names = set(zip_obj.namelist())
+        # root/scenario/instance/ of the members, to find the experiments to replace
+        self._prefixes = {self._get_prefix(name) for name in self._names}
+
+    def get_name(self, *parts: str) -> str:
+        return "/".join((self.root,) + parts)
+
+    def get_experiments(self, scenario: str) -> set:
+        """
+        Names of the instances of the scenario that are in the zip.
+        """
+        prefix = self.get_name(scenario) + "/"
+        return {
+            name[len(prefix) :].split("/")[0]
+            for name in self._names
+            if name.startswith(prefix) and name.count("/") > prefix.count("/")
+        }
+
+    def add_experiment(self, scenario: str, instance: str, files: dict) -> None:
+        """
+        :param files: {name: content} of the files of the experiment.
+            If the experiment was already in the zip, it is replaced.
+        """
+        prefix = self.get_name(scenario, instance) + "/"
+        members = {prefix + name: content for name, content in files.items()}
+        self._write(members, prefix)
+
+    def add_instance(self, name: str, content: str) -> None:
+        """
+        Adds a shared instance, if it is not in the zip yet.
+        """
+        member = self.get_name(INSTANCES_DIR, name)
+        if member not in self._names:
+            self._write({member: content})
+
+    def copy_experiment(self, scenario: str, instance: str, experiment_dir: str):
+        """
+        Adds an experiment from its directory, with its shared instance.
+        """
+        files = {
+            f: tools.read_text(os.path.join(experiment_dir, f))
+            for f in os.listdir(experiment_dir)
+        }
+        if INSTANCE_REF in files:
+            ref = json.loads(files[INSTANCE_REF])
+            inst_path = os.path.normpath(os.path.join(experiment_dir, ref["path"]))
+            self.add_instance(os.path.basename(inst_path), tools.read_text(inst_path))
+        self.add_experiment(scenario, instance, files)
+
+    def read_manifest(self, scenario: str) -> dict:
+        name = self.get_name(scenario, MANIFEST)
+        if name not in self._names:
+            return {}
+        with zipfile.ZipFile(self.path) as zip_obj:
+            return tools.load_data_zip(zip_obj, name) or {}
+
+    def write_manifest(self, scenario: str, manifest: dict) -> None:
+        """
+        Only the entries of the experiments that are in the zip are written
+        (the manifest of the tree can have experiments of previous runs).
+        """
+        experiments = self.get_experiments(scenario)
+        manifest = {k: v for k, v in manifest.items() if k in experiments}
+        self._write({self.get_name(scenario, MANIFEST): tools.dump_json(manifest)})
+
+    def _write(self, members: dict, prefix: str = None) -> None:
+        """
+        Adds the members {name: content} to the zip.
+        A zip cannot replace a member: if any of them, or any member that starts
+        with prefix, is already there, we copy the zip without them first.
+        """
+
+        def is_replaced(name):
+            return name in members or (prefix is not None and name.startswith(prefix))
+
+        if prefix in self._prefixes or not self._names.isdisjoint(members):
+            # it only happens when experiments are solved again
+            self._copy_without(is_replaced)
+            self._names = {name for name in self._names if not is_replaced(name)}
+            self._prefixes = {self._get_prefix(name) for name in self._names}
+        with zipfile.ZipFile(self.path, "a", zipfile.ZIP_DEFLATED) as zip_obj:
+            for name, content in members.items():
+                zip_obj.writestr(name, content)
+        self._names.update(members)
+        self._prefixes.update(self._get_prefix(name) for name in members)
+
+    @staticmethod
+    def _get_prefix(name: str) -> str:
+        return "/".join(name.split("/")[:3]) + "/"
+
+    def _copy_without(self, func) -> None:
+        tmp_path = self.path + ".tmp"
+        with zipfile.ZipFile(self.path) as source, zipfile.ZipFile(
+            tmp_path, "w", zipfile.ZIP_DEFLATED
+        ) as target:
+            for info in source.infolist():
+                if not func(info.filename):
+                    target.writestr(info, source.read(info))
+        os.replace(tmp_path, self.path)
 
 
 def solve_scenarios_and_zip(
@@ -78,26 +545,48 @@ def solve_scenarios_and_zip(
     path_to_dir: str,
     solver_name: str,
     zip: bool = False,
+    tree: bool = True,
     **kwargs
 ):
-    zipfile_name = path_to_dir + ".zip"
+    """
+    Solves the scenarios with solve_zip in path_to_dir.
+
+    :param zip: if True, the results are also added to path_to_dir.zip as
+        each experiment finishes.
+    :param tree: if False, the experiments are only written to the zip.
+    """
+    result_zip = None
+    if zip:
+        zipfile_name = path_to_dir + ".zip"
+        if os.path.exists(zipfile_name) and not kwargs.get("resume", False):
+            os.remove(zipfile_name)
+        root = os.path.basename(os.path.normpath(path_to_dir))
+        result_zip = ResultZip(zipfile_name, root)
     for scenario in scenarios:
-        solve_zip(scenario, path_to_dir + "/", solver_name=solver_name, **kwargs)
-    if not zip:
-        return
-    root_dir = "data"
-    base_dir = solver_name
-    if os.path.exists(zipfile_name):
-        os.remove(zipfile_name)
-    shutil.make_archive(path_to_dir, "zip", root_dir=root_dir, base_dir=base_dir)
-    # shutil.rmtree(path_to_dir)
-
-
-def get_table(zipfile_name: str):
-    batch = ZipBatch(zipfile_name)
-    objs = batch.get_objective_function()
-    opts = batch.get_options()
-    errors = batch.get_errors().vapply(lambda v: dict(errors=v))
+        solve_zip(
+            scenario,
+            path_to_dir + "/",
+            solver_name=solver_name,
+            result_zip=result_zip,
+            tree=tree,
+            **kwargs
+        )
+
+
+def get_table(zipfile_name: str, workers: int = 1, cache: bool = False):
+    """
+    :param workers: number of processes used to load and check the experiments
+    :param cache: if True, the summaries of the experiments are kept in a sqlite
+        file next to the zip (zipfile_name with .sqlite) and only new or changed
+        experiments are checked the next time
+    """
+    results_index = None
+    if cache:
+        results_index = os.path.splitext(zipfile_name)[0] + ".sqlite"
+    with ZipBatch(zipfile_name, workers=workers, results_index=results_index) as batch:
+        objs = batch.get_objective_function()
+        opts = batch.get_options()
+        errors = batch.get_errors().vapply(lambda v: dict(errors=v))
     opts.update(errors)
     opts_df = batch.format_df(opts).drop(["instance"], axis=1)
     table = (
@@ -62,8 +62,62 @@ def cli():
 @click.option(
     "--options", default="{}", cls=PythonJsonOption, help="Options to pass to solver."
 )
+@click.option(
+    "--reduce/--no-reduce",
+    default=False,
+    help="if given it removes useless modes, resources and precedences before solving.",
+)
+@click.option(
+    "--justify/--no-justify",
+    default=False,
+    help="if given it improves each solution with a forward-backward justification.",
+)
+@click.option(
+    "--workers",
+    default=1,
+    type=int,
+    help="number of processes used to solve the instances in parallel.",
+)
+@click.option(
+    "--timeout",
+    default=None,
+    type=float,
+    help="if given, each solve is killed after this number of seconds.",
+)
+@click.option(
+    "--tree/--no-tree",
+    default=True,
+    help="if not given, the results are only written to the zip (needs --zip).",
+)
+@click.option(
+    "--share-instances/--no-share-instances",
+    default=True,
+    help="if given each instance is written once in _instances instead of an "
+    "input.json per experiment.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    help="if given it skips the experiments already finished with the same solver "
+    "and options.",
+)
 def solve_scenarios(
-    directory, scenarios, scenario, solver, test, instances, instance, zip, options
+    directory,
+    scenarios,
+    scenario,
+    solver,
+    test,
+    instances,
+    instance,
+    zip,
+    options,
+    reduce,
+    justify,
+    workers,
+    timeout,
+    tree,
+    share_instances,
+    resume,
 ):
     """Solves a batch of instances inside a zip with a solver and zips the results"""
     # print(scenarios)
@@ -82,15 +136,33 @@ def solve_scenarios(
         instances=instances,
         zip=zip,
         options=options,
+        reduce=reduce,
+        justify=justify,
+        workers=workers,
+        timeout=timeout,
+        tree=tree,
+        share_instances=share_instances,
+        resume=resume,
     )
 
 
 @cli.command()
 @click.option("--path", default="default", help="the path to the zipfile to analyse.")
 @click.option("--path_out", help="the path for the output csv.")
-def export_table(path, path_out):
+@click.option(
+    "--workers",
+    default=1,
+    type=int,
+    help="number of processes used to check the experiments.",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=False,
+    help="keep the checks in a sqlite file next to the zip, for the next export.",
+)
+def export_table(path, path_out, workers, cache):
     """Reads a result zip and exports the table in a csv"""
-    table = rb.get_table(path)
+    table = rb.get_table(path, workers=workers, cache=cache)
     table.to_csv(path_out, index=False)
     return
 
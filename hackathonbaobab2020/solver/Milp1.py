@@ -58,7 +58,7 @@ class Milp1(Experiment):
             )
             for j in jobs
         }
-        periods = [p for p in range(sum(v for v in max_duration.values()))]
+        periods = [p for p in range(self.instance.graph.horizon)]
 
         self.input_data["max_duration"] = max_duration
         self.input_data["sJobs"] = {None: jobs}
@@ -95,6 +95,7 @@ class Milp1(Experiment):
             options["SOLVER_PARAMETERS"] = SOLVER_PARAMETERS
 
         model_instance = model.create_instance(data, report_timing=False)
+        self.fix_time_windows(model_instance)
         opt = SolverFactory("cbc")
         opt.options.update(options["SOLVER_PARAMETERS"])
         result = opt.solve(model_instance, tee=False)
@@ -114,6 +115,19 @@ class Milp1(Experiment):
 
         return get_status_value(self.status)
 
+    def fix_time_windows(self, model_instance):
+        """
+        Jobs cannot start outside the time windows of the critical path:
+        we fix those start variables to 0.
+        """
+        graph = self.instance.graph
+        periods = self.input_data["sPeriods"][None]
+        for job in self.input_data["sJobs"][None]:
+            earliest, latest = graph.earliest_start[job], graph.latest_start[job]
+            for period in periods:
+                if period < earliest or period > latest:
+                    model_instance.v01Start[job, period].fix(0)
+
     def print_instance(self):
         print("printing instance")
         with open("instance_display.txt", "w") as f:
@@ -1,5 +1,9 @@
 import warnings
 from .algorithm1 import Algorithm
+from .sgs import SerialSGS, ParallelSGS
+from .genetic import GeneticAlgorithm
+from .local_search import LocalSearch
+from .justification import justify
 
 try:
     from .cp_ortools import CPModel1
@@ -11,15 +15,24 @@ try:
 except ImportError:
     solvers = dict(
         default=Algorithm,
+        sgs=SerialSGS,
+        sgs_parallel=ParallelSGS,
+        ga=GeneticAlgorithm,
+        local_search=LocalSearch,
     )
     warnings.warn(
-        "Only solver='default' is available. \n"
+        "Only solvers 'default', 'sgs', 'sgs_parallel', 'ga' and 'local_search' "
+        + "are available. \n"
         + "To install dependencies for the other solvers: \n"
         + "`pip install hackathonbaobab2020[solvers]`"
     )
 else:
     solvers = dict(
         default=Algorithm,
+        sgs=SerialSGS,
+        sgs_parallel=ParallelSGS,
+        ga=GeneticAlgorithm,
+        local_search=LocalSearch,
         Milp_LP_HL=Milp1,
         ortools=CPModel1,
         Iterator_HL=Iterator1,
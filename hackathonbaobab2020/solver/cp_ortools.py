@@ -12,8 +12,10 @@ class CPModel1(Experiment):
         model = cp_model.CpModel()
         input_data = pt.SuperDict.from_dict(self.instance.data)
         durations_data = pt.SuperDict.from_dict(input_data["durations"])
-        max_dur_job = durations_data.vapply(lambda v: max(v.values()))
-        horizon = sum(max_dur_job.values()) + 1
+        graph = self.instance.graph
+        horizon = graph.horizon
+        earliest_start = graph.earliest_start
+        latest_start = graph.latest_start
         jobs_data = input_data["jobs"]
         needs_data = pt.SuperDict.from_dict(input_data["needs"])
         mode_dictionary_to_values = (
@@ -21,15 +23,22 @@ class CPModel1(Experiment):
         )
 
         # variable declaration:
+        # start times are restricted to the time windows of the critical path
         starts = pt.SuperDict(
             {
-                job: model.NewIntVar(0, horizon, "start_{}".format(job))
+                job: model.NewIntVar(
+                    earliest_start[job], latest_start[job], "start_{}".format(job)
+                )
                 for job in jobs_data
             }
         )
         ends = pt.SuperDict(
             {
-                job: model.NewIntVar(0, horizon, "end_{}".format(job))
+                job: model.NewIntVar(
+                    earliest_start[job] + graph.min_duration[job],
+                    horizon,
+                    "end_{}".format(job),
+                )
                 for job in jobs_data
             }
         )
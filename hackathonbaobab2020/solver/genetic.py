@@ -0,0 +1,228 @@
+from hackathonbaobab2020.core import Experiment
+from hackathonbaobab2020.core.evaluation import evaluate_batch
+from hackathonbaobab2020.core.experiment import (
+    STATUS_FEASIBLE,
+    STATUS_INFEASIBLE,
+    STATUS_OPTIMAL,
+)
+from concurrent.futures import ProcessPoolExecutor
+from .sgs import (
+    get_executable_modes,
+    get_priorities,
+    repair_modes,
+    sample_modes,
+    sample_priorities,
+    select_modes,
+    serial_sgs,
+    to_solution,
+)
+import heapq
+import numpy as np
+import time
+
+RULES = ["LFT", "MTS", "GRPW"]
+
+# the instance arrays of each worker process (see GeneticAlgorithm)
+_worker = {}
+
+
+def to_activity_list(arrays, priorities: np.ndarray) -> np.ndarray:
+    """
+    Jobs in an order that respects the precedences: among the jobs whose
+    predecessors are already in the list, the one with the lowest priority goes next.
+
+    :return: positions of the jobs
+    """
+    waiting = np.bincount(arrays.arcs[1], minlength=arrays.n_jobs)
+    eligible = [(priorities[j], j) for j in range(arrays.n_jobs) if not waiting[j]]
+    heapq.heapify(eligible)
+    order = []
+    while eligible:
+        _, job = heapq.heappop(eligible)
+        order.append(job)
+        for successor in arrays.successors(job):
+            waiting[successor] -= 1
+            if not waiting[successor]:
+                heapq.heappush(eligible, (priorities[successor], successor))
+    return np.array(order, dtype=np.int64)
+
+
+def decode(arrays, lists: np.ndarray, modes: np.ndarray) -> np.ndarray:
+    """
+    Serial SGS of each individual: the jobs are scheduled in the order of
+    its activity list.
+
+    :param lists: activity lists (individuals x jobs)
+    :param modes: positions of the modes (individuals x jobs)
+    :return: start times (individuals x jobs)
+    """
+    positions = np.empty_like(lists)
+    rows = np.arange(len(lists))[:, None]
+    positions[rows, lists] = np.arange(lists.shape[1])
+    return np.array(
+        [serial_sgs(arrays, p, m) for p, m in zip(positions, modes)], dtype=np.int64
+    ).reshape(lists.shape)
+
+
+def crossover(mother, father, rng: np.random.Generator):
+    """
+    One point crossover of the activity lists and the mode vectors.
+    The child takes the first jobs of the list of the mother and the rest in
+    the order of the father, so the precedences are still respected.
+    The modes of the first jobs (by position in arrays.jobs) come from the mother.
+
+    :param mother: (activity list, modes)
+    :param father: (activity list, modes)
+    :return: (activity list, modes) of the child
+    """
+    n_jobs = len(mother[0])
+    cut = rng.integers(1, n_jobs)
+    head = mother[0][:cut]
+    rest = father[0][~np.isin(father[0], head)]
+    cut = rng.integers(1, n_jobs)
+    modes = np.concatenate([mother[1][:cut], father[1][cut:]])
+    return np.concatenate([head, rest]), modes
+
+
+def mutate(arrays, child, rng: np.random.Generator, rate: float, executable):
+    """
+    Each job of the activity list is swapped with the next one with
+    probability rate, if the next one is not its successor.
+    Each job takes a random executable mode with probability rate.
+    """
+    activities, modes = child
+    for i in np.flatnonzero(rng.random(len(activities) - 1) < rate):
+        if activities[i + 1] not in arrays.successors(activities[i]):
+            activities[i], activities[i + 1] = activities[i + 1], activities[i]
+    modes = sample_modes(arrays, modes, 1, rng, rate, executable)[0]
+    return activities, modes
+
+
+def _start_worker(arrays):
+    _worker["arrays"] = arrays
+
+
+def _decode_worker(lists, modes):
+    return decode(_worker["arrays"], lists, modes)
+
+
+class GeneticAlgorithm(Experiment):
+    """
+    Genetic algorithm over (activity list, mode vector) individuals.
+    Individuals are decoded with the serial SGS and a whole generation is
+    evaluated at once (see core.evaluation.evaluate_batch).
+    The fitness is the makespan plus penalty for each unit of non-renewable
+    resource over the availability. Children over the availability have
+    their modes repaired first (see repair_modes).
+    Each generation, the best individuals among parents and children survive.
+
+    The first individuals come from the priority rules, the rest are sampled
+    around LFT (see sample_priorities and sample_modes).
+
+    Options:
+
+    * timeLimit: seconds (10 by default).
+    * seed: for the random numbers (0 by default).
+    * population: number of individuals (40 by default).
+    * generations: maximum number of generations (100 by default,
+        None for no maximum).
+    * mutation: probability of each mutation (0.05 by default).
+    * penalty: per unit of excess of non-renewable resources
+        (the horizon by default).
+    * workers: number of processes that decode the children (1 by default).
+    """
+
+    def __init__(self, instance, solution=None):
+        super().__init__(instance, solution)
+        return
+
+    def solve(self, options):
+        deadline = time.time() + options.get("timeLimit", 10)
+        rng = np.random.default_rng(options.get("seed", 0))
+        size = options.get("population", 40)
+        generations = options.get("generations", 100)
+        rate = options.get("mutation", 0.05)
+        workers = options.get("workers", 1)
+        graph = self.instance.graph
+        penalty = options.get("penalty", graph.horizon)
+        lower_bound = graph.get_critical_path_length()
+        arrays = self.instance.arrays
+        executable = get_executable_modes(arrays)
+
+        modes = select_modes(arrays, executable)
+        keys = [get_priorities(self.instance, modes, rule) for rule in RULES]
+        keys.extend(sample_priorities(keys[0], size - len(keys), rng))
+        lists = np.array([to_activity_list(arrays, k) for k in keys[:size]])
+        population = np.vstack(
+            [
+                np.tile(modes, (len(RULES), 1)),
+                sample_modes(arrays, modes, size - len(RULES), rng, 0.1, executable),
+            ]
+        )[:size]
+
+        executor = None
+        if workers > 1:
+            executor = ProcessPoolExecutor(
+                max_workers=workers, initializer=_start_worker, initargs=(arrays,)
+            )
+
+        def evaluate(lists, modes):
+            if executor is None:
+                starts = decode(arrays, lists, modes)
+            else:
+                chunks = zip(
+                    np.array_split(lists, workers), np.array_split(modes, workers)
+                )
+                starts = np.vstack(list(executor.map(_decode_worker, *zip(*chunks))))
+            result = evaluate_batch(arrays, modes, starts)
+            return starts, result["makespan"] + penalty * result["resources_nr"]
+
+        try:
+            starts, fitness = evaluate(lists, population)
+            generation = 0
+            while time.time() < deadline and fitness.min() > lower_bound:
+                if generations is not None and generation >= generations:
+                    break
+                generation += 1
+                # each parent is the best of two random individuals
+                chosen = rng.integers(0, size, (2 * size, 2))
+                winners = np.where(
+                    fitness[chosen[:, 0]] <= fitness[chosen[:, 1]],
+                    chosen[:, 0],
+                    chosen[:, 1],
+                )
+                children = []
+                for mother, father in winners.reshape(size, 2):
+                    child = crossover(
+                        (lists[mother], population[mother]),
+                        (lists[father], population[father]),
+                        rng,
+                    )
+                    activities, child_modes = mutate(
+                        arrays, child, rng, rate, executable
+                    )
+                    child_modes = repair_modes(arrays, child_modes, executable)
+                    children.append((activities, child_modes))
+                child_lists = np.array([c[0] for c in children])
+                child_modes = np.array([c[1] for c in children])
+                child_starts, child_fitness = evaluate(child_lists, child_modes)
+                lists = np.vstack([lists, child_lists])
+                population = np.vstack([population, child_modes])
+                starts = np.vstack([starts, child_starts])
+                fitness = np.concatenate([fitness, child_fitness])
+                survivors = np.argsort(fitness, kind="stable")[:size]
+                lists, population = lists[survivors], population[survivors]
+                starts, fitness = starts[survivors], fitness[survivors]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        best = fitness.argmin()
+        self.solution = to_solution(arrays, starts[best], population[best])
+        chosen = slice(best, best + 1)
+        result = evaluate_batch(arrays, population[chosen], starts[chosen])
+        if result["resources_nr"][0]:
+            return STATUS_INFEASIBLE
+        if result["makespan"][0] == lower_bound:
+            return STATUS_OPTIMAL
+        return STATUS_FEASIBLE
@@ -0,0 +1,99 @@
+from hackathonbaobab2020.core import Experiment
+from .sgs import _earliest_fit, to_solution
+import numpy as np
+
+
+def justify(experiment: Experiment, passes: int = 10) -> bool:
+    """
+    Forward-backward improvement (double justification) of the solution of
+    an experiment, after solve(). The modes are not changed.
+
+    Each pass moves every job as late as possible (right justification), in
+    order of decreasing finish time, and then as early as possible
+    (left justification), in order of increasing start time.
+    Passes stop when the makespan does not improve.
+    The solution is only replaced by a better one. Solutions that miss jobs
+    or break precedences or renewable resources are left as they are
+    (the non-renewable resources do not depend on the start times).
+
+    :param passes: maximum number of passes
+    :return: True if the solution was replaced
+    """
+    arrays = experiment.instance.arrays
+    if experiment.solution.data.keys() != arrays.job_index.keys():
+        return False
+    graph = experiment.instance.graph
+    jobs, modes, starts = experiment.get_solution_positions()
+    order = np.empty(arrays.n_jobs, dtype=np.int64)
+    order[jobs] = np.arange(arrays.n_jobs)
+    modes, starts = modes[order], starts[order]
+    # ties are broken with the precedences (some jobs take no time)
+    rank = np.array([graph.position[j] for j in arrays.jobs])
+    durations = arrays.durations[np.arange(arrays.n_jobs), modes]
+    makespan = int((starts + durations).max())
+    mode_ids = np.asarray(arrays.modes)[modes]
+    if not _respects_times(experiment, starts, mode_ids):
+        return False
+
+    best = makespan
+    for _ in range(passes):
+        # right justification: a left justification of the reversed schedule,
+        # where times are measured from the end
+        order = np.lexsort((-rank, -(starts + durations)))
+        reversed_starts = _left_justify(arrays, modes, order, backward=True)
+        end = (reversed_starts + durations).max()
+        right_starts = end - reversed_starts - durations
+        order = np.lexsort((rank, right_starts))
+        new_starts = _left_justify(arrays, modes, order)
+        new_makespan = int((new_starts + durations).max())
+        if new_makespan >= best:
+            break
+        best, starts = new_makespan, new_starts
+    if best >= makespan:
+        return False
+    if not _respects_times(experiment, starts, mode_ids):
+        return False
+    experiment.solution = to_solution(arrays, starts, modes)
+    return True
+
+
+def _respects_times(experiment: Experiment, starts, modes) -> bool:
+    result = experiment.evaluate_batch(starts, modes)
+    errors = [result[k][0] for k in ["modes", "successors", "resources_r"]]
+    return not any(errors)
+
+
+def _left_justify(arrays, modes: np.ndarray, order: np.ndarray, backward=False):
+    """
+    Each job, in the given order, starts at the first period where its
+    predecessors have finished and its renewable resources are free.
+    With backward, successors take the place of predecessors: the times are
+    then measured from the end of the schedule.
+
+    :param order: positions of the jobs, every job after the ones it depends on
+    :return: start times aligned with arrays.jobs
+    """
+    n_jobs = arrays.n_jobs
+    jobs = np.arange(n_jobs)
+    durations = arrays.durations[jobs, modes]
+    needs = arrays.needs[jobs, modes][:, arrays.renewable]
+    available = arrays.availability[arrays.renewable]
+    before, after = arrays.arcs
+    if backward:
+        before, after = after, before
+    following = [after[before == job] for job in jobs]
+    usage = np.zeros((len(available), int(durations.sum()) + 1), dtype=np.int64)
+    starts = np.zeros(n_jobs, dtype=np.int64)
+    ready = np.zeros(n_jobs, dtype=np.int64)
+    last_finish = 0
+    for job in order:
+        duration = durations[job]
+        start = _earliest_fit(
+            usage, needs[job], available, ready[job], last_finish, duration
+        )
+        starts[job] = start
+        usage[:, start : start + duration] += needs[job][:, None]
+        finish = start + duration
+        last_finish = max(last_finish, finish)
+        ready[following[job]] = np.maximum(ready[following[job]], finish)
+    return starts
@@ -0,0 +1,235 @@
+from hackathonbaobab2020.core import Experiment
+from hackathonbaobab2020.core.incremental import IncrementalEvaluator
+from hackathonbaobab2020.core.experiment import (
+    STATUS_FEASIBLE,
+    STATUS_INFEASIBLE,
+    STATUS_OPTIMAL,
+)
+from .sgs import _earliest_fit, get_executable_modes, to_solution
+import numpy as np
+import time
+
+MOVES = ["shift", "swap", "mode"]
+
+
+class Neighbourhood(object):
+    """
+    Random shift, swap and mode-change moves over an IncrementalEvaluator.
+    Jobs and modes are handled by position (see instance.arrays).
+
+    * shift: a job starts at the first period where it fits after its
+      predecessors or a few periods before or after its current start.
+    * swap: two jobs exchange their start times.
+    * mode: a job takes another executable mode, keeping its start time.
+    """
+
+    def __init__(self, evaluator: IncrementalEvaluator, rng: np.random.Generator):
+        arrays = self.arrays = evaluator.arrays
+        self.evaluator = evaluator
+        self.rng = rng
+        before, after = arrays.arcs
+        self.predecessors = [before[after == job] for job in range(arrays.n_jobs)]
+        executable = get_executable_modes(arrays)
+        self.modes = [np.flatnonzero(row) for row in executable]
+        self.durations = arrays.durations.max(axis=1)
+
+    def sample(self) -> tuple:
+        """
+        :return: (move, jobs, values) with the positions of the jobs and
+            their new start times (or mode positions).
+        """
+        rng, evaluator = self.rng, self.evaluator
+        move = MOVES[rng.integers(len(MOVES))]
+        job = int(rng.integers(self.arrays.n_jobs))
+        if move == "mode" and len(self.modes[job]) > 1:
+            others = self.modes[job][self.modes[job] != evaluator.modes[job]]
+            return move, [job], [int(rng.choice(others))]
+        if move == "swap":
+            other = int(rng.integers(self.arrays.n_jobs))
+            return move, [job, other], [evaluator.starts[other], evaluator.starts[job]]
+        if rng.random() < 0.5:
+            start = self.get_earliest_fit(job)
+        else:
+            delta = rng.integers(1, max(self.durations[job], 1) + 1)
+            start = evaluator.starts[job] + rng.choice([-delta, delta])
+        return "shift", [job], [max(int(start), 0)]
+
+    def get_earliest_fit(self, job: int) -> int:
+        """
+        First period after the predecessors of the job where its renewable
+        resources are free, in its current mode.
+        """
+        arrays, evaluator = self.arrays, self.evaluator
+        mode = evaluator.modes[job]
+        start, finish = evaluator.starts[job], evaluator.finishes[job]
+        need = arrays.needs[job, mode][arrays.renewable]
+        usage = evaluator.usage.copy()
+        usage[:, start:finish] -= need[:, None]
+        return _earliest_fit(
+            usage,
+            need,
+            arrays.availability[arrays.renewable],
+            evaluator.finishes[self.predecessors[job]].max(initial=0),
+            evaluator.makespan,
+            arrays.durations[job, mode],
+        )
+
+    def apply(self, move: str, jobs: list, values: list) -> int:
+        """
+        :return: number of changes applied to the evaluator (to undo them)
+        """
+        arrays, evaluator = self.arrays, self.evaluator
+        for job, value in zip(jobs, values):
+            if move == "mode":
+                evaluator.set_mode(arrays.jobs[job], arrays.modes[value])
+            else:
+                evaluator.move(arrays.jobs[job], int(value))
+        return len(jobs)
+
+    def undo(self, changes: int) -> None:
+        for _ in range(changes):
+            self.evaluator.undo()
+
+
+class LocalSearch(Experiment):
+    """
+    Simulated annealing or tabu search over shift, swap and mode-change
+    moves (see Neighbourhood), evaluated with core.incremental.IncrementalEvaluator.
+
+    It improves the solution of the experiment. If there is none, it first runs
+    another registered solver (initial_solver) with part of the time limit,
+    so it can be used as a post-processing stage of any solver.
+
+    The cost of a schedule is its makespan plus penalty for each violation
+    (see IncrementalEvaluator.get_violations) and a tie-breaker below one
+    that prefers earlier finish times.
+    Every feasible schedule better than the incumbent becomes the solution,
+    and (seconds, makespan) is added to the trajectory.
+
+    Options:
+
+    * timeLimit: seconds, including the initial solver (10 by default).
+    * seed: for the random numbers (0 by default).
+    * method: "annealing" (by default) or "tabu".
+    * iterations: maximum number of moves (20000 by default).
+    * initial_solver: name of the solver for the first solution ("sgs" by default).
+    * initial_time: share of timeLimit for the initial solver (0.5 by default).
+    * penalty: per unit of violation (3 by default). A low penalty lets the
+      search go through infeasible schedules.
+    * temperature: initial temperature of the annealing (2 by default).
+    * cooling: the temperature is multiplied by it after each move
+      (0.9995 by default).
+    * neighbours: moves evaluated at each iteration of the tabu search
+      (20 by default).
+    * tenure: iterations a job stays tabu after it changes (7 by default).
+    """
+
+    def __init__(self, instance, solution=None):
+        super().__init__(instance, solution)
+        self.trajectory = []
+        return
+
+    def solve(self, options):
+        begin = time.time()
+        time_limit = options.get("timeLimit", 10)
+        deadline = begin + time_limit
+        rng = np.random.default_rng(options.get("seed", 0))
+        method = options.get("method", "annealing")
+        if method not in ["annealing", "tabu"]:
+            raise ValueError("Unknown method: {}".format(method))
+        iterations = options.get("iterations", 20000)
+        graph = self.instance.graph
+        penalty = options.get("penalty", 3)
+        lower_bound = graph.get_critical_path_length()
+
+        if not self.solution.data:
+            # imported here: this module is registered in the same package
+            from . import get_solver
+
+            name = options.get("initial_solver", "sgs")
+            initial = get_solver(name)(self.instance)
+            share = options.get("initial_time", 0.5)
+            initial.solve(dict(options, timeLimit=time_limit * share))
+            self.solution = initial.solution
+
+        arrays = self.instance.arrays
+        evaluator = IncrementalEvaluator(self.instance, self.solution)
+        neighbourhood = Neighbourhood(evaluator, rng)
+        tie = 1 / (arrays.n_jobs * graph.horizon + 1)
+
+        def get_cost():
+            violations = (
+                evaluator.successors + evaluator.resources_nr + evaluator.resources_r
+            )
+            return (
+                evaluator.makespan
+                + penalty * violations
+                + tie * evaluator.finishes.sum()
+            )
+
+        self.trajectory = []
+        best = None
+        if evaluator.is_feasible():
+            best = evaluator.makespan
+            self.trajectory.append((round(time.time() - begin, 3), best))
+
+        def update_incumbent():
+            nonlocal best
+            if not evaluator.is_feasible():
+                return
+            if best is not None and evaluator.makespan >= best:
+                return
+            best = evaluator.makespan
+            self.solution = to_solution(arrays, evaluator.starts, evaluator.modes)
+            self.trajectory.append((round(time.time() - begin, 3), best))
+
+        cost = get_cost()
+        temperature = options.get("temperature", 2)
+        cooling = options.get("cooling", 0.9995)
+        neighbours = options.get("neighbours", 20)
+        tenure = options.get("tenure", 7)
+        tabu = np.zeros(arrays.n_jobs, dtype=np.int64)
+        iteration = 0
+        while iteration < iterations and time.time() < deadline:
+            if best == lower_bound:
+                break
+            iteration += 1
+            if method == "annealing":
+                changes = neighbourhood.apply(*neighbourhood.sample())
+                new_cost = get_cost()
+                delta = new_cost - cost
+                accepted = delta <= 0 or rng.random() < np.exp(-delta / temperature)
+                temperature *= cooling
+                if not accepted:
+                    neighbourhood.undo(changes)
+                    continue
+                cost = new_cost
+                update_incumbent()
+                continue
+            # tabu: the best of a sample of moves, if its jobs are not tabu
+            # or it gives a new incumbent
+            chosen, chosen_cost = None, None
+            for _ in range(neighbours):
+                candidate = neighbourhood.sample()
+                changes = neighbourhood.apply(*candidate)
+                new_cost = get_cost()
+                improves = evaluator.is_feasible() and (
+                    best is None or evaluator.makespan < best
+                )
+                neighbourhood.undo(changes)
+                if (tabu[candidate[1]] >= iteration).any() and not improves:
+                    continue
+                if chosen is None or new_cost < chosen_cost:
+                    chosen, chosen_cost = candidate, new_cost
+            if chosen is None:
+                continue
+            neighbourhood.apply(*chosen)
+            tabu[chosen[1]] = iteration + tenure
+            cost = chosen_cost
+            update_incumbent()
+
+        if best is None:
+            return STATUS_INFEASIBLE
+        if best == lower_bound:
+            return STATUS_OPTIMAL
+        return STATUS_FEASIBLE
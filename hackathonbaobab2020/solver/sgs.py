@@ -0,0 +1,479 @@
+from hackathonbaobab2020.core import Experiment, Solution
+from hackathonbaobab2020.core.experiment import STATUS_FEASIBLE, STATUS_INFEASIBLE
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+import numpy as np
+import pytups as pt
+import time
+
+# the data of each worker process (see ParallelSGS)
+_worker = {}
+
+
+def get_executable_modes(arrays) -> np.ndarray:
+    """
+    Modes whose needs fit in the availability of every resource.
+    Jobs without any of them keep all their modes.
+
+    :return: array (jobs x modes) of booleans
+    """
+    fits = (arrays.needs <= arrays.availability).all(axis=2) & arrays.mode_mask
+    return np.where(fits.any(axis=1)[:, None], fits, arrays.mode_mask)
+
+
+def select_modes(arrays, executable: np.ndarray = None) -> np.ndarray:
+    """
+    Each job starts in its shortest executable mode and the modes are
+    repaired (see repair_modes).
+    If that is not enough, modes are searched for (see search_modes).
+
+    :return: positions of the modes, aligned with arrays.jobs
+    """
+    if executable is None:
+        executable = get_executable_modes(arrays)
+    durations = np.where(executable, arrays.durations, np.iinfo(np.int64).max)
+    modes = repair_modes(arrays, durations.argmin(axis=1), executable)
+    if get_excess_nr(arrays, modes):
+        found = search_modes(arrays, executable)
+        if found is not None:
+            return found
+    return modes
+
+
+def repair_modes(arrays, modes: np.ndarray, executable: np.ndarray) -> np.ndarray:
+    """
+    While the non-renewable resources are exceeded, the mode change that
+    reduces the excess the most is applied (the shortest one on ties).
+    The excess of each resource is relative to its availability.
+
+    :return: positions of the modes, aligned with arrays.jobs
+    """
+    modes = modes.copy()
+    non_renewable = ~arrays.renewable
+    if not non_renewable.any():
+        return modes
+    jobs = np.arange(arrays.n_jobs)
+    needs = arrays.needs[:, :, non_renewable]
+    available = arrays.availability[non_renewable]
+    scale = np.maximum(available, 1)
+    totals = needs[jobs, modes].sum(axis=0)
+
+    def get_excess(totals):
+        return (np.maximum(totals - available, 0) / scale).sum(axis=-1)
+
+    excess = get_excess(totals)
+    while excess > 0:
+        # totals after changing the mode of each job: (jobs x modes x resources)
+        changed = totals + needs - needs[jobs, modes][:, None, :]
+        candidates = np.where(executable, get_excess(changed), np.inf)
+        best = candidates.min()
+        if best >= excess:
+            break
+        job, mode = min(
+            zip(*np.nonzero(candidates == best)),
+            key=lambda k: arrays.durations[k],
+        )
+        totals = changed[job, mode]
+        modes[job] = mode
+        excess = best
+    return modes
+
+
+def search_modes(arrays, executable: np.ndarray, node_limit: int = 100000):
+    """
+    Depth first search of modes that respect the non-renewable resources,
+    shortest modes first. The jobs whose needs change the most between modes
+    go first. A branch is cut when its totals plus the smallest needs of the
+    remaining jobs exceed the availability of a resource.
+
+    :return: positions of the modes, or None if none were found
+        in node_limit nodes
+    """
+    non_renewable = ~arrays.renewable
+    needs = arrays.needs[:, :, non_renewable]
+    available = arrays.availability[non_renewable]
+    big = np.iinfo(np.int64).max
+    smallest = np.where(executable[:, :, None], needs, big).min(axis=1)
+    largest = np.where(executable[:, :, None], needs, 0).max(axis=1)
+    order = np.argsort(-(largest - smallest).sum(axis=1), kind="stable")
+    # smallest needs of the jobs after each depth
+    remaining = np.zeros((arrays.n_jobs + 1, len(available)), dtype=np.int64)
+    remaining[:-1] = np.cumsum(smallest[order][::-1], axis=0)[::-1]
+    remaining[:-1] -= smallest[order]
+    choices = [
+        sorted(np.flatnonzero(executable[job]), key=lambda m: arrays.durations[job, m])
+        for job in order
+    ]
+    modes = np.zeros(arrays.n_jobs, dtype=np.int64)
+    nodes = 0
+
+    def visit(depth, totals):
+        nonlocal nodes
+        if depth == len(order):
+            return True
+        nodes += 1
+        if nodes > node_limit:
+            return False
+        job = order[depth]
+        for mode in choices[depth]:
+            new_totals = totals + needs[job, mode]
+            if (new_totals + remaining[depth] <= available).all():
+                modes[job] = mode
+                if visit(depth + 1, new_totals):
+                    return True
+        return False
+
+    if visit(0, np.zeros(len(available), dtype=np.int64)):
+        return modes
+    return None
+
+
+def get_excess_nr(arrays, modes: np.ndarray) -> int:
+    """
+    Units of the non-renewable resources used above their availability.
+    """
+    non_renewable = ~arrays.renewable
+    used = arrays.needs[np.arange(arrays.n_jobs), modes][:, non_renewable].sum(axis=0)
+    return int(np.maximum(used - arrays.availability[non_renewable], 0).sum())
+
+
+def get_priorities(instance, modes: np.ndarray, rule: str = "LFT") -> np.ndarray:
+    """
+    Priority of each job for a priority rule: the lowest goes first.
+
+    * LFT: latest finish time (critical path with the minimum durations).
+    * MTS: most total successors, direct or not.
+    * GRPW: greatest rank positional weight: the duration of the job plus the
+        durations of its direct successors, in the selected modes.
+
+    :return: array aligned with instance.arrays.jobs
+    """
+    arrays = instance.arrays
+    graph = instance.graph
+    if rule == "LFT":
+        finish = graph.latest_start.kvapply(lambda k, v: v + graph.min_duration[k])
+        return arrays.to_positions(finish).astype(float)
+    if rule == "MTS":
+        return -arrays.to_positions(graph.count_all_successors()).astype(float)
+    if rule == "GRPW":
+        durations = arrays.durations[np.arange(arrays.n_jobs), modes]
+        before, after = arrays.arcs
+        weights = durations + np.bincount(
+            before, weights=durations[after], minlength=arrays.n_jobs
+        )
+        return -weights.astype(float)
+    raise ValueError("Unknown priority rule: {}".format(rule))
+
+
+def serial_sgs(arrays, priorities: np.ndarray, modes: np.ndarray) -> np.ndarray:
+    """
+    Serial schedule generation scheme.
+    Jobs are taken one at a time, the eligible one (all its predecessors
+    scheduled) with the lowest priority first, and start at the first period
+    where its predecessors have finished and its renewable resources are free.
+    The usage of the renewable resources is kept in a profile.
+
+    :param priorities: aligned with arrays.jobs, the lowest goes first
+    :param modes: positions of the modes, aligned with arrays.jobs
+    :return: start times aligned with arrays.jobs
+    """
+    n_jobs = arrays.n_jobs
+    jobs = np.arange(n_jobs)
+    durations = arrays.durations[jobs, modes]
+    needs = arrays.needs[jobs, modes][:, arrays.renewable]
+    available = arrays.availability[arrays.renewable]
+    before, after = arrays.arcs
+    waiting = np.bincount(after, minlength=n_jobs)
+    # periods after the last finish are free: the profile never needs to grow
+    usage = np.zeros((len(available), int(durations.sum()) + 1), dtype=np.int64)
+    starts = np.zeros(n_jobs, dtype=np.int64)
+    ready = np.zeros(n_jobs, dtype=np.int64)
+    last_finish = 0
+    eligible = [(priorities[j], j) for j in jobs if not waiting[j]]
+    heapq.heapify(eligible)
+    while eligible:
+        _, job = heapq.heappop(eligible)
+        duration = durations[job]
+        start = _earliest_fit(
+            usage, needs[job], available, ready[job], last_finish, duration
+        )
+        starts[job] = start
+        usage[:, start : start + duration] += needs[job][:, None]
+        finish = start + duration
+        last_finish = max(last_finish, finish)
+        for successor in arrays.successors(job):
+            ready[successor] = max(ready[successor], finish)
+            waiting[successor] -= 1
+            if not waiting[successor]:
+                heapq.heappush(eligible, (priorities[successor], successor))
+    return starts
+
+
+def _earliest_fit(usage, need, available, start, last_finish, duration) -> int:
+    """
+    First period from start where a job fits in the profile during duration periods.
+    """
+    used = need > 0
+    if not duration or not used.any() or start >= last_finish:
+        return start
+    free = available[used, None] - usage[used, start:last_finish]
+    fits = (free >= need[used, None]).all(axis=0)
+    # after last_finish every period is free
+    fits = np.concatenate([fits, np.ones(duration, dtype=bool)])
+    busy = np.concatenate([[0], np.cumsum(~fits)])
+    windows = busy[duration:] - busy[:-duration]
+    return start + int(np.flatnonzero(windows == 0)[0])
+
+
+def parallel_sgs(arrays, priorities: np.ndarray, modes: np.ndarray) -> np.ndarray:
+    """
+    Parallel (time incremental) schedule generation scheme.
+    Time goes from one finish time to the next. At each time, the eligible
+    jobs (all their predecessors finished) start in priority order while
+    their renewable resources are free. Every scheduled job has started by
+    then, so the usage can only go down later: a job fits if it fits now.
+
+    :param priorities: aligned with arrays.jobs, the lowest goes first
+    :param modes: positions of the modes, aligned with arrays.jobs
+    :return: start times aligned with arrays.jobs
+    """
+    n_jobs = arrays.n_jobs
+    jobs = np.arange(n_jobs)
+    durations = arrays.durations[jobs, modes]
+    needs = arrays.needs[jobs, modes][:, arrays.renewable]
+    free = arrays.availability[arrays.renewable].copy()
+    waiting = np.bincount(arrays.arcs[1], minlength=n_jobs)
+    starts = np.zeros(n_jobs, dtype=np.int64)
+    eligible = [(priorities[j], j) for j in jobs if not waiting[j]]
+    # (finish, job) of the jobs in process
+    in_process = []
+    now = 0
+    scheduled = 0
+    while scheduled < n_jobs:
+        while in_process and in_process[0][0] <= now:
+            _, job = heapq.heappop(in_process)
+            free += needs[job]
+            for successor in arrays.successors(job):
+                waiting[successor] -= 1
+                if not waiting[successor]:
+                    eligible.append((priorities[successor], successor))
+        postponed = []
+        for priority, job in sorted(eligible):
+            # a job that does not fit even alone starts anyway
+            if (needs[job] <= free).all() or not in_process:
+                starts[job] = now
+                free -= needs[job]
+                heapq.heappush(in_process, (now + durations[job], job))
+                scheduled += 1
+            else:
+                postponed.append((priority, job))
+        eligible = postponed
+        if in_process and in_process[0][0] > now:
+            now = in_process[0][0]
+    return starts
+
+
+SCHEMES = dict(serial=serial_sgs, parallel=parallel_sgs)
+
+
+def sample_priorities(
+    priorities: np.ndarray, size: int, rng: np.random.Generator, bias: float = 1.0
+) -> np.ndarray:
+    """
+    Biased random sampling around a priority rule.
+    The regret of a job is how much better its priority is than the worst one.
+    Each sampled priority is -(bias * log(1 + regret) + Gumbel noise), so the
+    job that goes first among a set of eligible jobs is picked with a
+    probability proportional to (1 + regret) ** bias.
+
+    :return: array (size x jobs) of priorities, the lowest goes first
+    """
+    regret = priorities.max() - priorities
+    weights = bias * np.log1p(regret)
+    return -(weights + rng.gumbel(size=(size, len(priorities))))
+
+
+def sample_modes(
+    arrays,
+    modes: np.ndarray,
+    size: int,
+    rng: np.random.Generator,
+    rate: float,
+    executable: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Random changes of modes: each job takes a random executable mode with
+    probability rate. Samples that exceed the non-renewable resources keep
+    the given modes.
+
+    :return: array (size x jobs) of positions of modes
+    """
+    if executable is None:
+        executable = get_executable_modes(arrays)
+    jobs = np.arange(arrays.n_jobs)
+    keys = np.where(executable, rng.random((size,) + executable.shape), -1)
+    sampled = np.where(rng.random((size, len(jobs))) < rate, keys.argmax(axis=2), modes)
+    non_renewable = ~arrays.renewable
+    used = arrays.needs[jobs, sampled][:, :, non_renewable].sum(axis=1)
+    exceeded = (used > arrays.availability[non_renewable]).any(axis=1)
+    sampled[exceeded] = modes
+    return sampled
+
+
+def run_passes(arrays, priorities, modes, options, seed, size, deadline):
+    """
+    Decodes size sampled priorities and modes, stopping at deadline or at
+    a schedule with the makespan of lower_bound.
+
+    :param options: scheme, bias, mode_rate and lower_bound (see ParallelSGS)
+    :return: (makespan, starts, modes) of the best schedule,
+        or None if there was no time
+    """
+    if time.time() > deadline:
+        return None
+    rng = np.random.default_rng(seed)
+    all_priorities = sample_priorities(priorities, size, rng, options["bias"])
+    all_modes = sample_modes(arrays, modes, size, rng, options["mode_rate"])
+    decode = SCHEMES[options["scheme"]]
+    jobs = np.arange(arrays.n_jobs)
+    best = None
+    for sampled, sampled_modes in zip(all_priorities, all_modes):
+        if time.time() > deadline:
+            break
+        starts = decode(arrays, sampled, sampled_modes)
+        makespan = int((starts + arrays.durations[jobs, sampled_modes]).max())
+        if best is None or makespan < best[0]:
+            best = makespan, starts, sampled_modes
+        if makespan <= options["lower_bound"]:
+            break
+    return best
+
+
+def _start_worker(*args):
+    _worker["args"] = args
+
+
+def _run_worker_passes(seed, size, deadline):
+    return run_passes(*_worker["args"], seed, size, deadline)
+
+
+def to_solution(arrays, starts: np.ndarray, modes: np.ndarray) -> Solution:
+    """
+    :param starts: start times aligned with arrays.jobs
+    :param modes: positions of the modes aligned with arrays.jobs
+    """
+    data = pt.SuperDict(
+        {
+            job: pt.SuperDict(period=int(starts[i]), mode=arrays.modes[modes[i]])
+            for i, job in enumerate(arrays.jobs)
+        }
+    )
+    return Solution(data)
+
+
+class SerialSGS(Experiment):
+    """
+    Serial schedule generation scheme with a priority rule.
+    Modes are chosen before scheduling (see select_modes).
+
+    Options:
+
+    * rule: the priority rule, one of LFT (default), MTS or GRPW.
+    """
+
+    def __init__(self, instance, solution=None):
+        super().__init__(instance, solution)
+        return
+
+    def solve(self, options):
+        arrays = self.instance.arrays
+        modes = select_modes(arrays)
+        priorities = get_priorities(self.instance, modes, options.get("rule", "LFT"))
+        starts = serial_sgs(arrays, priorities, modes)
+        self.solution = to_solution(arrays, starts, modes)
+        # precedences and renewable resources are respected by construction
+        if get_excess_nr(arrays, modes):
+            return STATUS_INFEASIBLE
+        return STATUS_FEASIBLE
+
+
+class ParallelSGS(Experiment):
+    """
+    Parallel schedule generation scheme with a priority rule
+    (see parallel_sgs and select_modes).
+    The first pass uses the rule and the rest use priorities sampled around
+    it (see sample_priorities) until timeLimit, the maximum number of passes
+    or a schedule as short as the critical path. The best schedule is kept.
+    Passes run in batches, in a process pool if workers > 1.
+
+    Options:
+
+    * rule: the priority rule, one of LFT (default), MTS or GRPW.
+    * passes: maximum number of passes (10000 by default).
+    * timeLimit: seconds for all the passes (10 by default).
+    * seed: for the sampling (0 by default).
+    * bias: how much the sampling follows the rule (1 by default).
+    * mode_rate: probability that a pass changes the mode of a job
+        (0.1 by default, see sample_modes).
+    * scheme: parallel (default) or serial.
+    * workers: number of processes (1 by default).
+    * batch_size: passes sent to a process at once (100 by default).
+    """
+
+    def __init__(self, instance, solution=None):
+        super().__init__(instance, solution)
+        return
+
+    def solve(self, options):
+        deadline = time.time() + options.get("timeLimit", 10)
+        passes = options.get("passes", 10000)
+        workers = options.get("workers", 1)
+        batch_size = options.get("batch_size", 100)
+        scheme = options.get("scheme", "parallel")
+        if scheme not in SCHEMES:
+            raise ValueError("Unknown scheme: {}".format(scheme))
+        arrays = self.instance.arrays
+        modes = select_modes(arrays)
+        priorities = get_priorities(self.instance, modes, options.get("rule", "LFT"))
+        starts = SCHEMES[scheme](arrays, priorities, modes)
+        durations = arrays.durations[np.arange(arrays.n_jobs), modes]
+        best = int((starts + durations).max()), starts, modes
+
+        sizes = [batch_size] * ((passes - 1) // batch_size)
+        if (passes - 1) % batch_size:
+            sizes.append((passes - 1) % batch_size)
+        sampling = dict(
+            scheme=scheme,
+            bias=options.get("bias", 1),
+            mode_rate=options.get("mode_rate", 0.1),
+            lower_bound=self.instance.graph.get_critical_path_length(),
+        )
+        args = (arrays, priorities, modes, sampling)
+        seeds = [[options.get("seed", 0), i] for i in range(len(sizes))]
+        if best[0] <= sampling["lower_bound"]:
+            # the first pass cannot be improved
+            results = []
+        elif workers <= 1 or len(sizes) <= 1:
+            results = []
+            for seed, size in zip(seeds, sizes):
+                result = run_passes(*args, seed, size, deadline)
+                results.append(result)
+                if result is not None and result[0] <= sampling["lower_bound"]:
+                    break
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=_start_worker, initargs=args
+            ) as executor:
+                results = list(
+                    executor.map(
+                        _run_worker_passes, seeds, sizes, [deadline] * len(sizes)
+                    )
+                )
+        for result in results:
+            if result is not None and result[0] < best[0]:
+                best = result
+        makespan, starts, modes = best
+        self.solution = to_solution(arrays, starts, modes)
+        if get_excess_nr(arrays, modes):
+            return STATUS_INFEASIBLE
+        return STATUS_FEASIBLE
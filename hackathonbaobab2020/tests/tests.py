@@ -3,10 +3,77 @@ import sys, os
 prev_dir = os.path.join(os.path.dirname(__file__), "..", "..")
 print(prev_dir)
 sys.path.insert(1, prev_dir)
+import json
+import multiprocessing
 import unittest
+import warnings
 import shutil
 from jsonschema import Draft7Validator
-from hackathonbaobab2020 import solve_zip, Experiment, HackathonApp
+import tempfile
+import time
+import zipfile
+import pytups as pt
+from hackathonbaobab2020 import solve_zip, Experiment, HackathonApp, Instance, Solution
+from hackathonbaobab2020 import Batch, ZipBatch, get_table, solve_scenarios_and_zip
+from hackathonbaobab2020.execution.run_batch import solve_supervised, STATUS_TIMEOUT
+from hackathonbaobab2020.execution.run_batch import ResultZip, is_finished
+from hackathonbaobab2020.execution.run_batch import STATUS_NAMES
+from hackathonbaobab2020.core.experiment import STATUS_INFEASIBLE
+from hackathonbaobab2020.core.experiment import STATUS_FEASIBLE, STATUS_OPTIMAL
+from hackathonbaobab2020.tests import get_test_instance
+from hackathonbaobab2020.core import cache
+from hackathonbaobab2020.core.cache import InstanceCache, ResultsIndex
+from hackathonbaobab2020.core.incremental import IncrementalEvaluator
+from hackathonbaobab2020.solver import get_solver, justify, sgs
+from hackathonbaobab2020.core.tools import load_data, write_json, write_text
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../data/")
+
+# the tests (and the processes they start) use a temporary disk cache of instances
+_cache_dir = None
+_previous_cache_dir = None
+
+
+def setUpModule():
+    global _cache_dir, _previous_cache_dir
+    _cache_dir = tempfile.TemporaryDirectory()
+    _previous_cache_dir = os.environ.get("HACKATHON_CACHE_DIR")
+    os.environ["HACKATHON_CACHE_DIR"] = _cache_dir.name
+    cache._instance_cache = None
+
+
+def tearDownModule():
+    if _previous_cache_dir is None:
+        os.environ.pop("HACKATHON_CACHE_DIR", None)
+    else:
+        os.environ["HACKATHON_CACHE_DIR"] = _previous_cache_dir
+    cache._instance_cache = None
+    _cache_dir.cleanup()
+
+
+CBC_LOG = """\
+Welcome to the CBC MILP Solver
+Version: 2.10.3
+Build Date: Dec 15 2019
+
+command line - cbc m.lp solve (default strategy 1)
+ CoinLpIO::readLp(): Maximization problem reformulated as minimization
+Coin0009I Switching back to maximization to get correct duals etc
+Continuous objective value is 11.35 - 0.00 seconds
+Cgl0004I processed model has 3 rows, 3 columns (3 integer (0 of which binary)) and 8 elements
+Cbc0001I Search completed - best objective -10, took 6 iterations and 0 nodes (0.00 seconds)
+
+Result - Optimal solution found
+
+Objective value:                10.00000000
+Enumerated nodes:               0
+Total iterations:               6
+Time (CPU seconds):             0.00
+Time (Wallclock seconds):       0.00
+
+Total time (CPU seconds):       0.00   (Wallclock seconds):       0.00
+
+"""
 
 
 class BaseSolverTest:
@@ -18,7 +85,7 @@ class BaseSolverTest:
             self.path_out = os.path.join(test_dir, "../../data/" + self.solver + "/")
 
         def tearDown(self):
-            shutil.rmtree(self.path_out)
+            shutil.rmtree(self.path_out, ignore_errors=True)
 
         def run_scenario_instance(self, scenario, instance):
             path_in = os.path.join(
@@ -75,6 +142,176 @@ class TestCPModel1(BaseSolverTest.HackathonTests):
         return self.run_scenario_instance("c15.mm", "c158_4.mm")
 
 
+def get_infeasible_instance():
+    """
+    c154_3.mm without non-renewable resources: every schedule is infeasible.
+    """
+    data = get_test_instance("c15.mm.zip", "c154_3.mm").to_dict()
+    data["resources"] = [
+        dict(r, available=0) if r["id"].startswith("N") else r
+        for r in data["resources"]
+    ]
+    return Instance.from_dict(data)
+
+
+class TestSerialSGS(BaseSolverTest.HackathonTests):
+    solver = "sgs"
+
+    def test_c15(self):
+        return self.run_scenario_instance("c15.mm", "c154_3.mm")
+
+    def test_rules(self):
+        for name in ["c154_3.mm", "c158_3.mm", "c158_4.mm"]:
+            instance = get_test_instance("c15.mm.zip", name)
+            lower_bound = instance.graph.get_critical_path_length()
+            for rule in ["LFT", "MTS", "GRPW"]:
+                experiment = get_solver("sgs")(instance)
+                self.assertEqual(experiment.solve(dict(rule=rule)), 2)
+                self.assertEqual(experiment.check_solution().to_lendict(), {})
+                self.assertGreaterEqual(experiment.get_objective(), lower_bound)
+        with self.assertRaises(ValueError):
+            get_solver("sgs")(instance).solve(dict(rule="FIFO"))
+
+    def test_infeasible(self):
+        instance = get_infeasible_instance()
+        for name in ["sgs", "sgs_parallel"]:
+            experiment = get_solver(name)(instance)
+            self.assertEqual(experiment.solve(dict(passes=1)), STATUS_INFEASIBLE)
+
+
+class TestParallelSGS(BaseSolverTest.HackathonTests):
+    solver = "sgs_parallel"
+
+    def test_sampling(self):
+        instance = get_test_instance("j10.mm.zip", "j102_4.mm")
+        single = get_solver("sgs_parallel")(instance)
+        single.solve(dict(rule="GRPW", passes=1))
+        results = []
+        for workers in [1, 2]:
+            experiment = get_solver("sgs_parallel")(instance)
+            options = dict(rule="GRPW", passes=201, batch_size=50, workers=workers)
+            self.assertEqual(experiment.solve(options), 2)
+            self.assertEqual(experiment.check_solution().to_lendict(), {})
+            self.assertLessEqual(experiment.get_objective(), single.get_objective())
+            results.append(experiment.solution.data)
+        self.assertEqual(results[0], results[1])
+        # there is no time for the sampled passes
+        experiment = get_solver("sgs_parallel")(instance)
+        experiment.solve(dict(rule="GRPW", passes=1000, timeLimit=0))
+        self.assertEqual(experiment.solution.data, single.solution.data)
+
+    def test_default_passes(self):
+        instance = get_test_instance("c15.mm.zip", "c154_3.mm")
+        calls = []
+        decode = sgs.SCHEMES["parallel"]
+
+        def counting(*args):
+            calls.append(1)
+            return decode(*args)
+
+        sgs.SCHEMES["parallel"] = counting
+        try:
+            experiment = get_solver("sgs_parallel")(instance)
+            start = time.time()
+            self.assertEqual(experiment.solve(dict(timeLimit=1)), 2)
+            self.assertLess(time.time() - start, 5)
+        finally:
+            sgs.SCHEMES["parallel"] = decode
+        self.assertGreater(len(calls), 1)
+        self.assertEqual(experiment.check_solution().to_lendict(), {})
+
+
+class TestGeneticAlgorithm(BaseSolverTest.HackathonTests):
+    solver = "ga"
+
+    def test_generations(self):
+        instance = get_test_instance("c15.mm.zip", "c154_3.mm")
+        start = get_solver("sgs")(instance)
+        start.solve({})
+        results = []
+        for workers in [1, 2]:
+            experiment = get_solver("ga")(instance)
+            options = dict(generations=10, population=20, seed=3, workers=workers)
+            self.assertIn(experiment.solve(options), [STATUS_OPTIMAL, STATUS_FEASIBLE])
+            self.assertEqual(experiment.check_solution().to_lendict(), {})
+            self.assertLessEqual(experiment.get_objective(), start.get_objective())
+            results.append(experiment.solution.data)
+        self.assertEqual(results[0], results[1])
+        infeasible = get_solver("ga")(get_infeasible_instance())
+        options = dict(generations=2, population=10)
+        self.assertEqual(infeasible.solve(options), STATUS_INFEASIBLE)
+        # it stops at the time limit
+        experiment = get_solver("ga")(instance)
+        begin = time.time()
+        experiment.solve(dict(timeLimit=1, penalty=1000))
+        self.assertLess(time.time() - begin, 5)
+        self.assertEqual(experiment.check_solution().to_lendict(), {})
+
+
+class TestLocalSearch(BaseSolverTest.HackathonTests):
+    solver = "local_search"
+
+    def test_improve(self):
+        instance = get_test_instance("j10.mm.zip", "j102_4.mm")
+        start = get_solver("sgs")(instance)
+        start.solve({})
+        for method in ["annealing", "tabu"]:
+            results = []
+            for _ in range(2):
+                experiment = get_solver("local_search")(instance, start.solution)
+                options = dict(method=method, iterations=300, seed=1)
+                status = experiment.solve(options)
+                self.assertIn(status, [STATUS_OPTIMAL, STATUS_FEASIBLE])
+                self.assertEqual(experiment.check_solution().to_lendict(), {})
+                makespans = [m for _, m in experiment.trajectory]
+                self.assertEqual(makespans[0], start.get_objective())
+                self.assertEqual(makespans, sorted(makespans, reverse=True))
+                self.assertEqual(experiment.get_objective(), makespans[-1])
+                results.append(experiment.solution.data)
+            self.assertEqual(results[0], results[1])
+        with self.assertRaises(ValueError):
+            get_solver("local_search")(instance).solve(dict(method="descent"))
+
+    def test_initial_solver(self):
+        instance = get_test_instance("c15.mm.zip", "c154_3.mm")
+        experiment = get_solver("local_search")(instance)
+        options = dict(initial_solver="sgs_parallel", iterations=100, rule="GRPW")
+        self.assertIn(experiment.solve(options), [STATUS_OPTIMAL, STATUS_FEASIBLE])
+        self.assertEqual(experiment.check_solution().to_lendict(), {})
+        infeasible = get_solver("local_search")(get_infeasible_instance())
+        options = dict(iterations=100)
+        self.assertEqual(infeasible.solve(options), STATUS_INFEASIBLE)
+
+
+class TestJustification(unittest.TestCase):
+    def test_default(self):
+        improved = 0
+        cases = [("c15.mm.zip", "c154_3.mm"), ("j10.mm.zip", "j102_5.mm")]
+        for zip_name, name in cases:
+            experiment = get_solver("default")(get_test_instance(zip_name, name))
+            experiment.solve({})
+            errors = experiment.check_solution().keys()
+            makespan, modes = experiment.get_objective(), experiment.get_modes()
+            improved += justify(experiment)
+            self.assertLessEqual(experiment.get_objective(), makespan)
+            self.assertEqual(experiment.get_modes(), modes)
+            self.assertEqual(experiment.check_solution().keys(), errors)
+            # a second call starts from a justified schedule
+            makespan = experiment.get_objective()
+            justify(experiment)
+            self.assertLessEqual(experiment.get_objective(), makespan)
+        self.assertGreater(improved, 0)
+
+    def test_infeasible(self):
+        instance = get_test_instance("j10.mm.zip", "j102_4.mm")
+        experiment = get_solver("default")(instance)
+        self.assertFalse(justify(experiment))
+        first = {j: dict(period=0, mode=1) for j in instance.data["jobs"]}
+        experiment.solution = Solution(pt.SuperDict(first))
+        self.assertFalse(justify(experiment))
+        self.assertEqual(experiment.solution.data, first)
+
+
 class TestIterator1(BaseSolverTest.HackathonTests):
     solver = "Iterator_HL"
 
@@ -103,6 +340,680 @@ class TestApp(unittest.TestCase):
                     raise TestFail("The solution checks have invalid format")
 
 
+def add_and_exit(zip_path, instance, files):
+    ResultZip(zip_path, "default").add_experiment("j10.mm", instance, files)
+    os._exit(1)
+
+
+class TestSolveZip(unittest.TestCase):
+    def solve(self, path_out, **kwargs):
+        solve_zip(
+            zip_name="j10.mm.zip",
+            path_out=path_out,
+            path_in=data_dir,
+            solver_name="default",
+            test=True,
+            **kwargs
+        )
+        return os.path.join(path_out, "j10.mm")
+
+    def test_workers(self):
+        options = dict(timeLimit=10, SOLVER_PARAMETERS=dict(ratio=0.2))
+        with tempfile.TemporaryDirectory() as path:
+            sequential = self.solve(os.path.join(path, "seq"), options=options)
+            parallel = self.solve(os.path.join(path, "par"), options=options, workers=2)
+            self.assertEqual(
+                sorted(os.listdir(sequential)), sorted(os.listdir(parallel))
+            )
+            for name in load_data(os.path.join(sequential, "manifest.json")):
+                first = Experiment.from_json(os.path.join(sequential, name))
+                second = Experiment.from_json(os.path.join(parallel, name))
+                self.assertEqual(first.solution.data, second.solution.data)
+                logs = [
+                    load_data(os.path.join(p, name, "options.json"))
+                    for p in [sequential, parallel]
+                ]
+                for _log in logs:
+                    _log.pop("time")
+                self.assertEqual(logs[0], logs[1])
+        self.assertEqual(options, dict(timeLimit=10, SOLVER_PARAMETERS=dict(ratio=0.2)))
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as path:
+            scenario = self.solve(os.path.join(path, "default"))
+            manifest_path = os.path.join(scenario, "manifest.json")
+            manifest = load_data(manifest_path)
+            self.assertEqual(len(manifest), 3)
+            failed, *finished = sorted(manifest)
+            manifest[failed]["error"] = "interrupted"
+            write_json(manifest, manifest_path)
+
+            def modified(name):
+                return os.path.getmtime(os.path.join(scenario, name, "options.json"))
+
+            before = {name: modified(name) for name in manifest}
+            self.solve(os.path.join(path, "default"), resume=True)
+            self.assertNotEqual(modified(failed), before[failed])
+            for name in finished:
+                self.assertEqual(modified(name), before[name])
+            self.assertIsNone(load_data(manifest_path)[failed]["error"])
+            # experiments stopped at the timeout are solved again
+            manifest = load_data(manifest_path)
+            manifest[failed]["status"] = "Timeout"
+            write_json(manifest, manifest_path)
+            before[failed] = modified(failed)
+            self.solve(os.path.join(path, "default"), resume=True)
+            self.assertNotEqual(modified(failed), before[failed])
+            for name in finished:
+                self.assertEqual(modified(name), before[name])
+            # with other options everything is solved again
+            self.solve(os.path.join(path, "default"), resume=True, options=dict(a=1))
+            for name in finished:
+                self.assertNotEqual(modified(name), before[name])
+
+            # the experiments are read from the manifest
+            paths = Batch(os.path.join(path, "default")).get_instances_paths()
+            self.assertEqual(
+                sorted(paths.keys()), [("j10.mm", k) for k in sorted(manifest)]
+            )
+            archive = shutil.make_archive(
+                os.path.join(path, "default"), "zip", root_dir=path, base_dir="default"
+            )
+            table = get_table(archive)
+            self.assertEqual(sorted(table["name"]), sorted(manifest))
+
+    def test_infeasible_finished(self):
+        self.assertNotEqual(STATUS_TIMEOUT, STATUS_INFEASIBLE)
+        entry = dict(solver="default", options_hash="a", error=None)
+        entry["status"] = STATUS_NAMES[STATUS_INFEASIBLE]
+        self.assertEqual(entry["status"], "Infeasible")
+        self.assertTrue(is_finished(entry, "default", "a"))
+        entry["status"] = STATUS_NAMES[STATUS_TIMEOUT]
+        self.assertFalse(is_finished(entry, "default", "a"))
+
+    def test_result_zip(self):
+        with tempfile.TemporaryDirectory() as path:
+            path_to_dir = os.path.join(path, "default")
+            solve_scenarios_and_zip(
+                ["j10.mm.zip"],
+                path_to_dir,
+                "default",
+                zip=True,
+                tree=False,
+                path_in=data_dir,
+                test=True,
+            )
+            self.assertFalse(os.path.exists(path_to_dir))
+            scenario = self.solve(os.path.join(path, "tree"))
+            with zipfile.ZipFile(path_to_dir + ".zip") as zip_obj:
+                for name in load_data(os.path.join(scenario, "manifest.json")):
+                    for file in ["input_ref.json", "output.json"]:
+                        zipped = zip_obj.read("default/j10.mm/{}/{}".format(name, file))
+                        with open(os.path.join(scenario, name, file)) as f:
+                            self.assertEqual(zipped.decode(), f.read())
+            table = get_table(path_to_dir + ".zip")
+            self.assertEqual(len(table), 3)
+
+    def test_result_zip_replace(self):
+        with tempfile.TemporaryDirectory() as path:
+            zip_path = os.path.join(path, "results.zip")
+            result_zip = ResultZip(zip_path, "default")
+            result_zip.add_experiment("j10.mm", "a", {"output.json": "1"})
+            result_zip.add_experiment("j10.mm", "b", {"output.json": "2"})
+            result_zip.add_experiment("j10.mm", "a", {"options.json": "3"})
+            result_zip.write_manifest("j10.mm", dict(a={}, b={}, c={}))
+            result_zip = ResultZip(zip_path, "default")
+            self.assertEqual(result_zip.get_experiments("j10.mm"), {"a", "b"})
+            self.assertEqual(result_zip.read_manifest("j10.mm"), dict(a={}, b={}))
+            with zipfile.ZipFile(zip_path) as zip_obj:
+                names = zip_obj.namelist()
+            self.assertEqual(len(names), len(set(names)))
+            self.assertNotIn("default/j10.mm/a/output.json", names)
+            self.assertIn("default/j10.mm/a/options.json", names)
+
+    def test_result_zip_partial(self):
+        with tempfile.TemporaryDirectory() as path:
+            zip_path = os.path.join(path, "results.zip")
+            result_zip = ResultZip(zip_path, "default")
+            result_zip.add_experiment("j10.mm", "a", {"output.json": "1"})
+            # the zip can be read while the batch runs
+            with zipfile.ZipFile(zip_path) as zip_obj:
+                self.assertEqual(zip_obj.read("default/j10.mm/a/output.json"), b"1")
+            result_zip.add_experiment("j10.mm", "b", {"output.json": "2"})
+            with zipfile.ZipFile(zip_path) as zip_obj:
+                self.assertEqual(len(zip_obj.namelist()), 2)
+            # a batch that is killed keeps the experiments it finished
+            process = multiprocessing.Process(
+                target=add_and_exit, args=(zip_path, "c", {"output.json": "3"})
+            )
+            process.start()
+            process.join()
+            self.assertEqual(process.exitcode, 1)
+            result_zip = ResultZip(zip_path, "default")
+            self.assertEqual(result_zip.get_experiments("j10.mm"), {"a", "b", "c"})
+            result_zip.add_experiment("j10.mm", "d", {"output.json": "4"})
+            with zipfile.ZipFile(zip_path) as zip_obj:
+                self.assertIsNone(zip_obj.testzip())
+                self.assertEqual(len(zip_obj.namelist()), 4)
+
+    def test_result_zip_subset(self):
+        # the manifest of the tree has experiments that are not in the zip
+        with tempfile.TemporaryDirectory() as path:
+            path_to_dir = os.path.join(path, "default")
+            kwargs = dict(path_in=data_dir, test=False)
+            solve_scenarios_and_zip(["j10.mm.zip"], path_to_dir, "default", **kwargs)
+            kwargs = dict(path_in=data_dir, test=True, zip=True)
+            solve_scenarios_and_zip(["j10.mm.zip"], path_to_dir, "default", **kwargs)
+            tree = load_data(os.path.join(path_to_dir, "j10.mm", "manifest.json"))
+            self.assertEqual(len(tree), 4)
+            with zipfile.ZipFile(path_to_dir + ".zip") as zip_obj:
+                manifest = json.loads(zip_obj.read("default/j10.mm/manifest.json"))
+            self.assertEqual(len(manifest), 3)
+            self.assertEqual(len(get_table(path_to_dir + ".zip", cache=False)), 3)
+
+    def test_zip_batch(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.solve(os.path.join(path, "default"))
+            archive = shutil.make_archive(
+                os.path.join(path, "default"), "zip", root_dir=path, base_dir="default"
+            )
+            with ZipBatch(archive) as batch:
+                index = batch.get_index()
+                self.assertEqual(len(index), 3)
+                for files in index.values():
+                    self.assertIn("input_ref.json", files)
+                    self.assertIn("options.json", files)
+                self.assertEqual(len(batch.get_options()), 3)
+                self.assertEqual(len(batch.get_cases()), 3)
+                self.assertEqual(len(batch.instances), 3)
+                zip_obj = batch.zipobj
+                self.assertIs(batch.zipobj, zip_obj)
+            self.assertIsNone(zip_obj.fp)
+            # experiments checked in a pool give the same table
+            sequential = get_table(archive, cache=False)
+            parallel = get_table(archive, workers=2, cache=False)
+            self.assertTrue(sequential.equals(parallel))
+            with ZipBatch(archive, workers=2) as batch:
+                summaries = batch.get_summaries()
+                self.assertEqual(batch.get_errors(), summaries.get_property("errors"))
+            self.assertEqual(summaries.keys_l(), batch.get_instances_paths().keys_l())
+            self.assertFalse(batch.cases)
+
+    def test_manifest_missing(self):
+        with tempfile.TemporaryDirectory() as path:
+            scenario = self.solve(os.path.join(path, "default"))
+            name = sorted(load_data(os.path.join(scenario, "manifest.json")))[0]
+            shutil.rmtree(os.path.join(scenario, name))
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                batch = Batch(os.path.join(path, "default"))
+                paths = batch.get_instances_paths()
+                self.assertEqual(len(batch.get_objective_function()), 2)
+            self.assertEqual(len(paths), 2)
+            self.assertNotIn(("j10.mm", name), paths)
+            self.assertTrue(any(name in str(w.message) for w in caught))
+
+    def test_zip_manifest_missing(self):
+        with tempfile.TemporaryDirectory() as path:
+            scenario = self.solve(os.path.join(path, "default"))
+            manifest_path = os.path.join(scenario, "manifest.json")
+            manifest = load_data(manifest_path)
+            manifest["missing.mm"] = dict(manifest[sorted(manifest)[0]])
+            write_json(manifest, manifest_path)
+            archive = shutil.make_archive(
+                os.path.join(path, "default"), "zip", root_dir=path, base_dir="default"
+            )
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                with ZipBatch(archive) as batch:
+                    index = batch.get_index()
+                self.assertEqual(len(index), 3)
+                self.assertNotIn(("j10.mm", "missing.mm"), index)
+                self.assertEqual(len(get_table(archive, cache=False)), 3)
+            self.assertTrue(any("missing.mm" in str(w.message) for w in caught))
+
+    def test_results_index(self):
+        with tempfile.TemporaryDirectory() as path:
+            scenario = self.solve(os.path.join(path, "default"))
+            results_index = os.path.join(path, "results.sqlite")
+
+            def get_checked(batch_class, batch_path):
+                CountingExperiment.checked = 0
+                batch = batch_class(
+                    batch_path, exp_obj=CountingExperiment, results_index=results_index
+                )
+                errors = batch.get_errors()
+                self.assertEqual(len(errors), 3)
+                return CountingExperiment.checked
+
+            self.assertEqual(get_checked(Batch, os.path.join(path, "default")), 3)
+            self.assertEqual(get_checked(Batch, os.path.join(path, "default")), 0)
+            # a changed solution is checked again
+            name = sorted(os.listdir(scenario))[0]
+            output = os.path.join(scenario, name, "output.json")
+            solution = load_data(output)
+            solution["assignment"][0]["period"] += 1
+            write_json(solution, output)
+            self.assertEqual(get_checked(Batch, os.path.join(path, "default")), 1)
+
+            archive = shutil.make_archive(
+                os.path.join(path, "default"), "zip", root_dir=path, base_dir="default"
+            )
+            os.remove(results_index)
+            self.assertEqual(get_checked(ZipBatch, archive), 3)
+            self.assertEqual(get_checked(ZipBatch, archive), 0)
+            sqlite_path = os.path.splitext(archive)[0] + ".sqlite"
+            table = get_table(archive)
+            self.assertFalse(os.path.exists(sqlite_path))
+            self.assertTrue(get_table(archive, cache=True).equals(table))
+            self.assertTrue(os.path.exists(sqlite_path))
+            self.assertTrue(get_table(archive, cache=True).equals(table))
+
+    def test_iter_experiments(self):
+        with tempfile.TemporaryDirectory() as path:
+            scenario = self.solve(os.path.join(path, "default"))
+            batch = Batch(os.path.join(path, "default"))
+            errors = batch.get_errors()
+            objectives = batch.get_objective_function()
+            self.assertIsNone(batch.cases)
+            self.assertEqual(len(errors), 3)
+            experiments = list(batch.iter_experiments())
+            self.assertEqual(
+                [(s, i) for s, i, _ in experiments],
+                batch.get_instances_paths().keys_l(),
+            )
+            cases = batch.get_cases()
+            for scenario_name, instance, experiment in experiments:
+                case = cases[scenario_name, instance]
+                self.assertEqual(experiment.solution.data, case.solution.data)
+                objective = objectives[scenario_name, instance]
+                self.assertEqual(experiment.get_objective(), objective)
+            checks = cases.vapply(lambda v: v.check_solution().to_lendict())
+            self.assertEqual(errors, checks.vapply(lambda v: sum(v.values())))
+            # without scenarios
+            batch = Batch(scenario, no_scenario=True, scenarios=["j102_4.mm"])
+            ((scenario_name, instance, experiment),) = batch.iter_experiments()
+            self.assertIsNone(scenario_name)
+            self.assertEqual(instance, "j102_4.mm")
+
+    def test_logs(self):
+        with tempfile.TemporaryDirectory() as path:
+            scenario = self.solve(os.path.join(path, "default"))
+            names = sorted(load_data(os.path.join(scenario, "manifest.json")))
+            # two different logs and a copy of the first one
+            for name, log in zip(names, [CBC_LOG, CBC_LOG + "\n", CBC_LOG]):
+                write_text(log, os.path.join(scenario, name, "results.log"))
+            results_index = os.path.join(path, "results.sqlite")
+            batch = Batch(
+                os.path.join(path, "default"), workers=2, results_index=results_index
+            )
+            logs = batch.get_logs(solver="CBC")
+            self.assertEqual(len(logs), 3)
+            for log in logs.values():
+                self.assertEqual(log["status"], "Optimal solution found")
+                self.assertEqual(log["best_solution"], -10)
+            with ResultsIndex(results_index) as index:
+                self.assertEqual(len(index.get_logs(logs.keys())), 0)
+                rows = index.connection.execute("SELECT hash FROM logs")
+                hashes = [row[0] for row in rows]
+                self.assertEqual(len(index.get_logs(hashes)), 2)
+            # the logs read from the index are the same as the parsed ones
+            for get_progress in [False, True]:
+                stored = Batch(
+                    os.path.join(path, "default"), results_index=results_index
+                ).get_logs(solver="CBC", get_progress=get_progress)
+                parsed = Batch(os.path.join(path, "default")).get_logs(
+                    solver="CBC", get_progress=get_progress
+                )
+                for name, log in parsed.items():
+                    self.assertEqual(log.keys(), stored[name].keys())
+                    for key, value in log.items():
+                        if key == "progress":
+                            self.assertTrue(value.equals(stored[name][key]))
+                        else:
+                            self.assertEqual(value, stored[name][key])
+            batch.logs = None
+            table = batch.get_log_df(solver="CBC")
+            self.assertEqual(table["matrix_post_constraints"].tolist(), [3, 3, 3])
+            self.assertNotIn("matrix_constraints", table)
+
+    def test_shared_instances(self):
+        with tempfile.TemporaryDirectory() as path:
+            scenario = self.solve(os.path.join(path, "default"))
+            instances = os.listdir(os.path.join(path, "default", "_instances"))
+            self.assertEqual(len(instances), 3)
+            # the same instance solved twice in the same batch
+            shutil.copytree(
+                os.path.join(scenario, "j102_4.mm"), os.path.join(scenario, "copy")
+            )
+            os.remove(os.path.join(scenario, "manifest.json"))
+            cases = Batch(os.path.join(path, "default")).get_cases()
+            self.assertEqual(len(cases), 4)
+            self.assertIs(
+                cases["j10.mm", "copy"].instance, cases["j10.mm", "j102_4.mm"].instance
+            )
+            original = get_test_instance("j10.mm.zip", "j102_4.mm")
+            self.assertEqual(
+                cases["j10.mm", "copy"].instance.to_dict(), original.to_dict()
+            )
+
+    def test_justify(self):
+        with tempfile.TemporaryDirectory() as path:
+            plain = self.solve(os.path.join(path, "plain"))
+            justified = self.solve(os.path.join(path, "justified"), justify=True)
+            improved = 0
+            for name in load_data(os.path.join(plain, "manifest.json")):
+                before = Experiment.from_json(os.path.join(plain, name))
+                after = Experiment.from_json(os.path.join(justified, name))
+                self.assertLessEqual(after.get_objective(), before.get_objective())
+                self.assertEqual(after.get_modes(), before.get_modes())
+                _log = load_data(os.path.join(justified, name, "options.json"))
+                improved += _log["justified"]
+            self.assertGreater(improved, 0)
+            _log = load_data(os.path.join(plain, name, "options.json"))
+            self.assertNotIn("justified", _log)
+
+
+class CountingExperiment(Experiment):
+    checked = 0
+
+    def check_solution(self, *args, **kwargs):
+        CountingExperiment.checked += 1
+        return super().check_solution(*args, **kwargs)
+
+
+class SlowSolver(Experiment):
+    def solve(self, options):
+        first = {j: dict(period=0, mode=1) for j in self.instance.data["jobs"]}
+        self.solution = Solution(pt.SuperDict(first))
+        time.sleep(60)
+        return 4
+
+
+class EmptyingSolver(Experiment):
+    def solve(self, options):
+        first = {j: dict(period=0, mode=1) for j in self.instance.data["jobs"]}
+        self.solution = Solution(pt.SuperDict(first))
+        # as Milp1 after a failed solve
+        self.solution = Solution(pt.SuperDict())
+        time.sleep(options.get("sleep", 0))
+        return 0
+
+
+class TestSupervised(unittest.TestCase):
+    def setUp(self):
+        self.instance = get_test_instance("j10.mm.zip", "j102_4.mm")
+
+    def test_timeout(self):
+        experiment = SlowSolver(self.instance, None)
+        with tempfile.TemporaryDirectory() as path:
+            incumbent = os.path.join(path, "incumbent.json")
+            start = time.time()
+            status = solve_supervised(experiment, {}, 2, incumbent)
+            self.assertLess(time.time() - start, 30)
+            self.assertFalse(os.path.exists(incumbent))
+        self.assertEqual(status, STATUS_TIMEOUT)
+        self.assertEqual(len(experiment.solution.data), len(self.instance.data["jobs"]))
+
+    def test_empty_solution(self):
+        n_jobs = len(self.instance.data["jobs"])
+        for options, timeout in [(dict(sleep=60), 2), ({}, 60)]:
+            experiment = EmptyingSolver(self.instance, None)
+            with tempfile.TemporaryDirectory() as path:
+                incumbent = os.path.join(path, "incumbent.json")
+                solve_supervised(experiment, options, timeout, incumbent)
+            self.assertEqual(len(experiment.solution.data), n_jobs)
+
+    def test_finished(self):
+        experiment = get_solver("default")(self.instance)
+        options = dict(timeLimit=10)
+        with tempfile.TemporaryDirectory() as path:
+            incumbent = os.path.join(path, "incumbent.json")
+            status = solve_supervised(experiment, options, 60, incumbent)
+        in_process = get_solver("default")(self.instance)
+        self.assertEqual(status, in_process.solve(dict(timeLimit=10)))
+        self.assertEqual(experiment.solution.data, in_process.solution.data)
+
+
+class TestInstance(unittest.TestCase):
+    def test_from_mm_stream(self):
+        zip_obj = zipfile.ZipFile(os.path.join(data_dir, "c15.mm.zip"))
+        content = zip_obj.read("c154_3.mm").decode().splitlines(True)
+        from_list = Instance.from_mm(path=None, content=content)
+        from_stream = get_test_instance("c15.mm.zip", "c154_3.mm")
+        self.assertEqual(from_list.to_dict(), from_stream.to_dict())
+        self.assertEqual(len(from_stream.data["jobs"]), 18)
+        self.assertEqual(from_stream.data["jobs"][1]["successors"], [2, 3, 4])
+        self.assertEqual(from_stream.get_renewable_resources(), ["R 1", "R 2"])
+
+    def test_arrays(self):
+        instance = get_test_instance("j10.mm.zip", "j102_4.mm")
+        arrays = instance.arrays
+        self.assertIs(arrays, instance.arrays)
+        data = instance.data
+        for job, modes in data["durations"].items():
+            i = arrays.job_index[job]
+            successors = [arrays.jobs[s] for s in arrays.successors(i)]
+            self.assertEqual(successors, data["jobs"][job]["successors"])
+            for mode, duration in modes.items():
+                m = arrays.mode_index[mode]
+                self.assertTrue(arrays.mode_mask[i, m])
+                self.assertEqual(arrays.durations[i, m], duration)
+                needs = dict(zip(arrays.resources, arrays.needs[i, m].tolist()))
+                self.assertEqual(needs, data["needs"][job][mode])
+        self.assertEqual(arrays.renewable.tolist(), [True, True, False, False])
+        instance.data = data
+        self.assertIsNot(arrays, instance.arrays)
+
+    def test_graph(self):
+        instance = get_test_instance("c15.mm.zip", "c154_3.mm")
+        graph = instance.graph
+        self.assertIs(graph, instance.graph)
+        order = graph.topological_order
+        self.assertEqual(sorted(order), sorted(instance.data["jobs"].keys()))
+        for job, data in instance.data["jobs"].items():
+            for successor in data["successors"]:
+                self.assertLess(order.index(job), order.index(successor))
+                self.assertIn(job, graph.predecessors[successor])
+                self.assertTrue(graph.is_after(successor, job))
+                self.assertFalse(graph.is_after(job, successor))
+                self.assertGreaterEqual(
+                    graph.earliest_start[successor],
+                    graph.earliest_start[job] + graph.min_duration[job],
+                )
+            self.assertLessEqual(graph.earliest_start[job], graph.latest_start[job])
+        self.assertEqual(graph.count_all_successors()[order[0]], len(order) - 1)
+
+    def test_reduce(self):
+        instance = get_test_instance("j10.mm.zip", "j102_4.mm")
+        reduced, reduction = instance.reduce()
+        self.assertEqual(len(reduction.removed_modes), 4)
+        for job, modes in reduced.data["durations"].items():
+            self.assertEqual(list(modes.keys()), list(range(1, len(modes) + 1)))
+            for mode, original in reduction.modes[job].items():
+                self.assertEqual(modes[mode], instance.data["durations"][job][original])
+        experiment = get_solver("default")(reduced)
+        experiment.solve({})
+        solution = reduction.restore_solution(experiment.solution)
+        restored = Experiment(instance, solution)
+        self.assertEqual(restored.get_objective(), experiment.get_objective())
+
+    def test_cache(self):
+        zip_obj = zipfile.ZipFile(os.path.join(data_dir, "j10.mm.zip"))
+        with tempfile.TemporaryDirectory() as path:
+            cache = InstanceCache(path)
+            first = cache.from_zip(zip_obj, "j102_4.mm")
+            second = cache.from_zip(zip_obj, "j102_4.mm")
+            self.assertEqual(cache.stats(), dict(hits=1, misses=1))
+            self.assertEqual(first.to_dict(), second.to_dict())
+            self.assertIsNot(first.data["jobs"], second.data["jobs"])
+            # a new cache (e.g., a new process) reads the entry from disk
+            other = InstanceCache(path)
+            third = other.from_zip(zip_obj, "j102_4.mm")
+            self.assertEqual(other.stats(), dict(hits=1, misses=0))
+            self.assertEqual(first.to_dict(), third.to_dict())
+
+    def test_cache_memory(self):
+        zip_obj = zipfile.ZipFile(os.path.join(data_dir, "j10.mm.zip"))
+        memory = InstanceCache()
+        memory.from_zip(zip_obj, "j102_4.mm")
+        memory.from_zip(zip_obj, "j102_4.mm")
+        self.assertEqual(memory.stats(), dict(hits=1, misses=1))
+        self.assertIsNone(memory.path)
+        # the shared cache only uses the disk if HACKATHON_CACHE_DIR is set
+        previous = cache._instance_cache
+        path = os.environ.pop("HACKATHON_CACHE_DIR")
+        try:
+            cache._instance_cache = None
+            self.assertIsNone(cache.get_instance_cache().path)
+            os.environ["HACKATHON_CACHE_DIR"] = path
+            cache._instance_cache = None
+            self.assertTrue(cache.get_instance_cache().path.startswith(path))
+        finally:
+            os.environ["HACKATHON_CACHE_DIR"] = path
+            cache._instance_cache = previous
+
+
+class TestExperiment(unittest.TestCase):
+    def setUp(self):
+        self.instance = get_test_instance("c15.mm.zip", "c154_3.mm")
+        # every job starts at 0 in mode 1: resources are exceeded
+        solution = {j: dict(period=0, mode=1) for j in self.instance.data["jobs"]}
+        self.experiment = Experiment(self.instance, Solution(solution))
+
+    def test_check_resources_renewable(self):
+        errors = self.experiment.check_resources_renewable()
+        data = self.instance.data
+        expected = []
+        for resource in self.instance.get_renewable_resources():
+            for period in range(self.experiment.get_objective() + 1):
+                used = sum(
+                    data["needs"][j][1][resource]
+                    for j in data["jobs"]
+                    if period < data["durations"][j][1]
+                )
+                available = data["resources"][resource]["available"]
+                if used > available:
+                    expected.append(
+                        dict(
+                            resource=resource, period=period, quantity=available - used
+                        )
+                    )
+        self.assertTrue(len(expected))
+        self.assertEqual(errors, expected)
+
+    def test_is_feasible(self):
+        self.assertFalse(self.experiment.is_feasible())
+        solver = get_solver("default")(self.instance)
+        solver.solve({})
+        self.assertEqual(solver.is_feasible(), not solver.check_solution())
+        arrays = self.instance.arrays
+        solution = solver.solution.data
+        starts = [solution[j]["period"] for j in arrays.jobs]
+        modes = [solution[j]["mode"] for j in arrays.jobs]
+        self.assertEqual(
+            self.experiment.is_feasible(starts, modes), solver.is_feasible()
+        )
+        # a successor that starts before its predecessor finishes
+        starts[arrays.job_index[18]] = 0
+        self.assertFalse(self.experiment.is_feasible(starts, modes))
+
+    def test_evaluate_batch(self):
+        solver = get_solver("default")(self.instance)
+        solver.solve({})
+        jobs = self.instance.arrays.jobs
+        candidates = [self.experiment, solver]
+        starts = [[e.get_start_times()[j] for j in jobs] for e in candidates]
+        modes = [[e.get_modes()[j] for j in jobs] for e in candidates]
+        result = self.experiment.evaluate_batch(starts, modes)
+        for pos, experiment in enumerate(candidates):
+            errors = experiment.check_solution()
+            self.assertEqual(result["makespan"][pos], experiment.get_objective())
+            self.assertEqual(
+                result["successors"][pos], len(errors.get("successors", []))
+            )
+            for check in ["resources_nr", "resources_r"]:
+                excess = -sum(v["quantity"] for v in errors.get(check, []))
+                self.assertEqual(result[check][pos], excess)
+        self.assertGreater(result["resources_r"][0], 0)
+        self.assertEqual(result["modes"].tolist(), [0, 0])
+        modes[1][0] = 99
+        self.assertEqual(self.experiment.evaluate_batch(starts, modes)["modes"][1], 1)
+
+    def test_cached_views(self):
+        experiment = self.experiment
+        makespan = experiment.get_objective()
+        self.assertIs(experiment.get_start_times(), experiment.get_start_times())
+        # assigning the data of the solution
+        experiment.solution.data = experiment.solution.data.vapply(
+            lambda v: dict(period=v["period"] + 1, mode=v["mode"])
+        )
+        self.assertEqual(experiment.get_objective(), makespan + 1)
+        # assigning a new solution
+        solution = experiment.solution.data.vapply(
+            lambda v: dict(period=v["period"] + 1, mode=v["mode"])
+        )
+        experiment.solution = Solution(solution)
+        self.assertEqual(experiment.get_objective(), makespan + 2)
+        # editing in place needs an explicit clear
+        experiment.solution.data[1]["period"] = makespan
+        experiment.clear_cache()
+        self.assertEqual(experiment.get_start_times()[1], makespan)
+        self.assertEqual(experiment.get_finished_times()[1], makespan)
+        # the mutators of the solution clear it
+        experiment.solution.set_assignment(1, makespan + 1, 1)
+        self.assertEqual(experiment.get_start_times()[1], makespan + 1)
+        experiment.solution.remove_assignment(1)
+        self.assertNotIn(1, experiment.get_start_times())
+        # incomplete assignments are left out
+        experiment.solution.data[1] = pt.SuperDict(mode=1)
+        experiment.clear_cache()
+        self.assertNotIn(1, experiment.get_start_times())
+        self.assertEqual(experiment.get_modes()[1], 1)
+
+
+class TestIncrementalEvaluator(unittest.TestCase):
+    def setUp(self):
+        self.instance = get_test_instance("c15.mm.zip", "c154_3.mm")
+        solver = get_solver("ortools")(self.instance)
+        solver.solve(dict(timeLimit=10))
+        self.solution = solver.solution
+        self.evaluator = IncrementalEvaluator(self.instance, self.solution)
+
+    def check_evaluator(self):
+        solution = self.evaluator.get_solution().data
+        jobs = self.instance.arrays.jobs
+        result = Experiment(self.instance, None).evaluate_batch(
+            [[solution[j]["period"] for j in jobs]],
+            [[solution[j]["mode"] for j in jobs]],
+        )
+        for key, value in self.evaluator.get_violations().items():
+            self.assertEqual(value, result[key][0])
+
+    def test_move(self):
+        evaluator = self.evaluator
+        self.assertTrue(evaluator.is_feasible())
+        makespan = evaluator.makespan
+        # the last job finishes later
+        delta = evaluator.move(18, makespan + 5)
+        self.assertEqual(delta["makespan"], 5)
+        # a job before its predecessors
+        delta = evaluator.move(15, 0)
+        self.assertGreater(delta["successors"], 0)
+        self.check_evaluator()
+        evaluator.set_mode(5, 3)
+        self.check_evaluator()
+        for _ in range(3):
+            evaluator.undo()
+        self.assertEqual(evaluator.get_solution().data, self.solution.data)
+        self.assertTrue(evaluator.is_feasible())
+        self.assertRaises(IndexError, evaluator.undo)
+
+    def test_wrong_mode(self):
+        self.assertRaises(ValueError, self.evaluator.set_mode, 5, 99)
+        self.assertRaises(ValueError, self.evaluator.move, 5, -1)
+
+
 class TestFail(Exception):
     pass
 
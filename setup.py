@@ -15,7 +15,7 @@ packages = [
 with open("README.md", "r") as fh:
     long_description = fh.read()
 
-install_requires = ["click", "pandas", "orloge", "cornflow_client"]
+install_requires = ["click", "numpy", "pandas", "orloge", "cornflow_client"]
 
 extras_require = {
     "benchmark": ["tabulate", "pygount", "plotly", "seaborn"],